@@ -0,0 +1,80 @@
+"""AquaMark Pro - watermarking every frame of animations and multi-page files
+
+Animated GIF, WebP and PNG files and multi-page TIFFs are read into an
+Animation: every frame as Pillow composites it, plus what is needed to write
+them back (per-frame durations, GIF disposal methods, the loop count). All
+frames share one compiled RenderPlan, so the text mask or logo is rendered
+once, and they are composited on a thread pool; Pillow and numpy release the
+GIL while blending. Decoding and encoding stay sequential, since each frame
+is coded against the one before it.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+
+# Formats Pillow can write more than one frame or page to
+MULTIFRAME_FORMATS = ("GIF", "WEBP", "PNG", "TIFF")
+TIMED_FORMATS = ("GIF", "WEBP", "PNG")
+
+
+def is_animated(image):
+    """True for images holding more than one frame or page"""
+    return getattr(image, "n_frames", 1) > 1
+
+
+@dataclass(frozen=True)
+class Animation:
+    """The frames of an animation or multi-page file and how to play them back"""
+    frames: tuple
+    durations: tuple = ()
+    disposals: tuple = ()
+    loop: int = None
+
+    @property
+    def size(self):
+        return self.frames[0].size
+
+    def map(self, func, workers=None):
+        """Return a copy with func applied to every frame, on up to workers threads (default: all cores)"""
+        workers = min(len(self.frames), workers or os.cpu_count() or 1)
+        if workers == 1:
+            frames = tuple(map(func, self.frames))
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aquamark-frames") as pool:
+                frames = tuple(pool.map(func, self.frames))
+        return replace(self, frames=frames)
+
+    def save_options(self, fmt):
+        """Image.save options that keep the timing of the frames after the first (save_all, append_images aside)"""
+        options = {}
+        if fmt in TIMED_FORMATS and any(self.durations):
+            options["duration"] = list(self.durations)
+        if fmt in TIMED_FORMATS and self.loop is not None:
+            options["loop"] = self.loop
+        if fmt == "GIF" and self.disposals:
+            options["disposal"] = list(self.disposals)
+        return options
+
+
+def read_animation(image):
+    """Decode every frame of image into an Animation, leaving image on its first frame"""
+    frames, durations, disposals = [], [], []
+    try:
+        for index in range(image.n_frames):
+            image.seek(index)
+            frames.append(image.copy())
+            durations.append(image.info.get("duration", 0))
+            disposals.append(getattr(image, "disposal_method", 0))
+    finally:
+        image.seek(0)
+    return Animation(tuple(frames), tuple(durations), tuple(disposals), image.info.get("loop"))
+
+
+def watermark_animation(animation, plan, backend="pillow", in_place=False, workers=None):
+    """Composite plan onto every frame of animation, frames in parallel.
+
+    in_place lets the frames themselves be modified, when the caller has no
+    further use for animation.
+    """
+    return animation.map(lambda frame: plan.apply(frame, in_place=in_place, backend=backend), workers)
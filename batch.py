@@ -0,0 +1,388 @@
+"""AquaMark Pro - headless batch watermarking
+
+Usable as a library (run_batch) or from the command line:
+
+    python batch.py photos/ -o out/ --text "© Dabeey 2025" --position "Bottom Right"
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict
+from PIL import Image
+
+from watermark import WatermarkSpec, POSITIONS, compile_plan
+from presets import CONFIG_PATH, load_presets
+from tiled import watermark_tiled, streamable_path
+from export import ExportTarget, PRESETS, export_all
+from cache import OutputCache, DEFAULT_MAX_BYTES
+from loader import apply_orientation
+from animation import is_animated, read_animation, watermark_animation
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff", ".ppm")
+JOURNAL_NAME = ".aquamark_journal"
+
+# Per-process state, filled in once by _init_worker
+_worker_state = {}
+
+
+class BatchReport:
+    """Outcome of a batch run"""
+
+    def __init__(self):
+        self.processed = 0
+        self.skipped = 0
+        self.cached = 0
+        self.failed = []
+        self.elapsed = 0.0
+
+    @property
+    def images_per_second(self):
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.processed} watermarked, {self.cached} from cache, {self.skipped} skipped, "
+                f"{len(self.failed)} failed in {self.elapsed:.1f}s "
+                f"({self.images_per_second:.1f} images/s)")
+
+
+def collect_inputs(sources):
+    """Expand directories, glob patterns and plain paths into a sorted list of image files"""
+    if isinstance(sources, str):
+        sources = [sources]
+
+    found = set()
+    for source in sources:
+        if os.path.isdir(source):
+            for entry in os.scandir(source):
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    found.add(os.path.abspath(entry.path))
+        elif os.path.isfile(source):
+            found.add(os.path.abspath(source))
+        else:
+            for path in glob.glob(source, recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                    found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+def output_path_for(input_path, output_dir, suffix="_watermarked", fmt=None, max_size=0, root=None):
+    """Output path for input_path; its folder below root, if given, is mirrored in output_dir"""
+    stem, ext = os.path.splitext(os.path.basename(input_path))
+    if fmt:
+        ext = "." + fmt.lower().lstrip(".")
+    if max_size:
+        suffix = f"{suffix}_{max_size}"
+    if root:
+        output_dir = os.path.normpath(os.path.join(output_dir, os.path.relpath(os.path.dirname(input_path), root)))
+    return os.path.join(output_dir, stem + suffix + ext)
+
+
+def output_targets(input_path, output_dir, suffix="_watermarked", formats=(None,),
+                   max_sizes=(0,), preset="balanced", metadata=True, root=None):
+    """Every output to write for one input: each requested format at each size cap"""
+    return [ExportTarget(output_path_for(input_path, output_dir, suffix, fmt, max_size, root),
+                         preset=preset, max_size=max_size, metadata=metadata)
+            for fmt in formats for max_size in max_sizes]
+
+
+def input_root(inputs):
+    """The deepest folder holding every input; outputs mirror the layout below it"""
+    return os.path.commonpath([os.path.dirname(path) for path in inputs]) if inputs else None
+
+
+def _init_worker(spec, tiled=False, backend="pillow", frame_workers=1):
+    # The spec is compiled (font parsed, text rendered) once per worker instead of once per image
+    _worker_state["spec"] = spec
+    _worker_state["plan"] = compile_plan(spec)
+    _worker_state["tiled"] = tiled
+    _worker_state["backend"] = backend
+    _worker_state["frame_workers"] = frame_workers
+
+
+def _watermark_file(input_path, targets):
+    spec = _worker_state["spec"]
+
+    if _worker_state["tiled"]:
+        # Write next to the target and rename so a crash never leaves a half-written output
+        output_path = targets[0].path
+        tmp_path = output_path + ".part"
+        try:
+            watermark_tiled(input_path, output_path, spec, target=tmp_path)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return input_path
+
+    with Image.open(input_path) as source:
+        if is_animated(source):
+            # Every frame or page, composited in parallel with the one compiled plan
+            watermarked = watermark_animation(read_animation(source), _worker_state["plan"],
+                                              _worker_state["backend"], in_place=True,
+                                              workers=_worker_state["frame_workers"])
+        else:
+            image = apply_orientation(source)
+            image.load()
+            watermarked = _worker_state["plan"].apply(image, in_place=True,
+                                                      backend=_worker_state["backend"])
+        # One decode and composite, then every format/size is encoded from it;
+        # source supplies the metadata and, for the "keep" preset, the JPEG tables
+        export_all(watermarked, targets, source=source)
+    return input_path
+
+
+def _load_journal(journal_path):
+    if not os.path.exists(journal_path):
+        return set()
+    with open(journal_path, encoding="utf-8") as journal:
+        return {line.rstrip("\n") for line in journal if line.strip()}
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def journal_entry(input_path, spec, targets, **settings):
+    """Journal line recording that input_path was rendered with spec into targets.
+
+    The line hashes the source's size and mtime (and the logo's) together with
+    every setting, so a re-run only skips inputs whose source and settings
+    are both unchanged.
+    """
+    payload = {
+        "source": _file_version(input_path),
+        "logo": _file_version(spec.logo) if spec.logo else None,
+        "spec": asdict(spec),
+        "targets": [asdict(target) for target in targets],
+        "settings": settings,
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{input_path}\t{digest}"
+
+
+def run_batch(sources, spec, output_dir, workers=None, suffix="_watermarked",
+              fmt=None, resume=True, progress=None, tiled=False, backend="pillow",
+              preset="balanced", max_sizes=(0,), cache=None, metadata=True):
+    """Watermark every image in sources with spec, spreading the work across processes.
+
+    Completed inputs are appended to a journal in output_dir, so re-running the
+    same job after a crash picks up where it stopped when resume is True.
+    Inputs whose source file or settings changed since are rendered again.
+    Inputs from different folders keep their layout below the folder they
+    share, so same-named files don't overwrite each other; inputs that would
+    still write the same output (photo.jpg and photo.png converted to one
+    format) fail instead.
+    With tiled=True images are streamed strip by strip (see tiled.py) and
+    written as PNG or TIFF, keeping memory bounded for huge inputs.
+    backend picks the blend implementation ("pillow" or "numpy").
+
+    fmt may be a single format or a list, and max_sizes a list of longest-edge
+    caps (0 for full size); every combination is written from one decode.
+    preset is the encoder preset from export.PRESETS. EXIF, ICC and XMP
+    metadata are copied to the outputs unless metadata is False.
+
+    cache, an OutputCache, serves outputs for inputs whose bytes and settings
+    it has seen before and stores every newly written output.
+    """
+    formats = [fmt] if fmt is None or isinstance(fmt, str) else list(fmt)
+    if tiled and len(formats) * len(max_sizes) > 1:
+        raise ValueError("Tiled mode writes a single full-size output per image")
+
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_NAME)
+    done = _load_journal(journal_path) if resume else set()
+
+    report = BatchReport()
+    pending = []
+    entries = {}
+    keys = {}
+    owners = {}
+    # The spec only names the logo file, so cache keys cover its contents too
+    logo = cache.source_digest(spec.logo) if cache is not None and spec.logo else None
+    inputs = collect_inputs(sources)
+    root = input_root(inputs)
+    for input_path in inputs:
+        targets = output_targets(input_path, output_dir, suffix, formats, max_sizes, preset, metadata, root)
+        if tiled:
+            targets = [ExportTarget(streamable_path(targets[0].path))]
+        clashes = [owners[os.path.normcase(t.path)] for t in targets if os.path.normcase(t.path) in owners]
+        if clashes:
+            report.failed.append((input_path, f"its output would overwrite the one for {clashes[0]}"))
+            continue
+        owners.update((os.path.normcase(t.path), input_path) for t in targets)
+        for target in targets:
+            os.makedirs(os.path.dirname(target.path), exist_ok=True)
+        try:
+            if cache is not None:
+                # With a cache, the journal entry is derived from the content-addressed keys, so
+                # an input is only skipped when its bytes and settings match the journalled run
+                keys[input_path] = [cache.key(input_path, spec, target, backend=backend, tiled=tiled,
+                                              logo=logo)
+                                    for target in targets]
+                digest = hashlib.sha256("".join(keys[input_path]).encode("ascii")).hexdigest()
+                entries[input_path] = f"{input_path}\t{digest}"
+            else:
+                entries[input_path] = journal_entry(input_path, spec, targets, backend=backend, tiled=tiled)
+        except OSError as e:
+            report.failed.append((input_path, str(e)))
+            continue
+        if entries[input_path] in done and all(os.path.exists(t.path) for t in targets):
+            report.skipped += 1
+        else:
+            pending.append((input_path, targets))
+
+    start = time.perf_counter()
+    with open(journal_path, "a" if resume else "w", encoding="utf-8") as journal:
+
+        def finished(input_path):
+            journal.write(entries[input_path] + "\n")
+            journal.flush()
+            report.elapsed = time.perf_counter() - start
+            if progress:
+                progress(report)
+
+        if cache is not None:
+            # Hits are copied out here in the parent; only misses reach the workers
+            misses = []
+            for input_path, targets in pending:
+                if all(cache.fetch(key, target.path, origin=input_path)
+                       for key, target in zip(keys[input_path], targets)):
+                    report.cached += 1
+                    finished(input_path)
+                else:
+                    misses.append((input_path, targets))
+            pending = misses
+
+        # Cores the file-level processes leave idle go to compositing animation frames
+        cores = os.cpu_count() or 1
+        frame_workers = max(1, cores // max(1, min(workers or cores, len(pending))))
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(spec, tiled, backend, frame_workers)) as executor:
+                futures = {executor.submit(_watermark_file, input_path, targets): (input_path, targets)
+                           for input_path, targets in pending}
+                for future in as_completed(futures):
+                    input_path, targets = futures[future]
+                    try:
+                        future.result()
+                        if cache is not None:
+                            for key, target in zip(keys[input_path], targets):
+                                cache.store(key, target.path, origin=input_path)
+                    except Exception as e:
+                        report.failed.append((input_path, str(e)))
+                        report.elapsed = time.perf_counter() - start
+                    else:
+                        report.processed += 1
+                        finished(input_path)
+        finally:
+            if cache is not None:
+                cache.save()
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AquaMark Pro batch watermarking")
+    parser.add_argument("sources", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument("--watermark-preset", metavar="NAME",
+                        help="Start from a saved watermark preset; options given explicitly override it")
+    parser.add_argument("--presets-file", default=CONFIG_PATH,
+                        help="INI or JSON file holding the watermark presets")
+    # Watermark options are left out of args unless given, so main can tell an explicit
+    # option (which overrides a preset, even at WatermarkSpec's default) from an absent one
+    parser.add_argument("--text", default=argparse.SUPPRESS)
+    parser.add_argument("--font", default=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=argparse.SUPPRESS)
+    parser.add_argument("--color", default=argparse.SUPPRESS)
+    parser.add_argument("--opacity", type=float, default=argparse.SUPPRESS)
+    parser.add_argument("--position", default=argparse.SUPPRESS, choices=POSITIONS)
+    parser.add_argument("--offset-x", type=int, default=argparse.SUPPRESS)
+    parser.add_argument("--offset-y", type=int, default=argparse.SUPPRESS)
+    parser.add_argument("--angle", type=float, default=argparse.SUPPRESS,
+                        help="Text rotation for --position Tiled, in degrees")
+    parser.add_argument("--tile-gap", type=int, default=argparse.SUPPRESS,
+                        help="Space between repeats for --position Tiled (0: the font size)")
+    parser.add_argument("--logo", default=argparse.SUPPRESS, metavar="PNG",
+                        help="Image logo to place instead of the text")
+    parser.add_argument("--logo-scale", type=float, default=argparse.SUPPRESS,
+                        help="Logo width as a fraction of each image's width")
+    parser.add_argument("--suffix", default="_watermarked")
+    parser.add_argument("--format", dest="fmt",
+                        help="Output format(s), comma-separated, e.g. png or jpg,webp")
+    parser.add_argument("--max-size", default="0",
+                        help="Longest-edge caps, comma-separated; 0 keeps full size, e.g. 0,1600")
+    parser.add_argument("--preset", choices=PRESETS, default="balanced",
+                        help="Encoder speed/size trade-off; keep re-uses a JPEG source's quantisation")
+    parser.add_argument("--strip-metadata", action="store_true",
+                        help="Don't copy EXIF, ICC profiles and XMP to the outputs")
+    parser.add_argument("-j", "--workers", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the journal and redo every image")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Stream huge images strip by strip; output is PNG or TIFF")
+    parser.add_argument("--backend", choices=["pillow", "numpy"], default="pillow",
+                        help="Blend implementation (numpy is faster for RGB and L images)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="Reuse outputs for unchanged inputs and settings from this cache directory")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2, metavar="MB",
+                        help="Largest the cache may grow before old entries are evicted")
+    return parser
+
+
+# WatermarkSpec field for each watermark option on the command line
+SPEC_OPTIONS = {
+    "text": "text",
+    "font": "font_family",
+    "size": "font_size",
+    "color": "color",
+    "opacity": "opacity",
+    "position": "position",
+    "offset_x": "offset_x",
+    "offset_y": "offset_y",
+    "angle": "angle",
+    "tile_gap": "tile_gap",
+    "logo": "logo",
+    "logo_scale": "logo_scale",
+}
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.watermark_preset:
+        presets = load_presets(args.presets_file)
+        if args.watermark_preset not in presets:
+            parser.error(f"no watermark preset named {args.watermark_preset!r} in {args.presets_file}")
+        base = presets[args.watermark_preset]
+    else:
+        base = WatermarkSpec()
+    spec = base.with_changes(**{field: getattr(args, option) for option, field in SPEC_OPTIONS.items()
+                                if hasattr(args, option)})
+
+    def progress(report):
+        print(f"\r{report.summary()}", end="", file=sys.stderr, flush=True)
+
+    cache = OutputCache(args.cache, args.cache_size * 1024 ** 2) if args.cache else None
+    report = run_batch(args.sources, spec, args.output, workers=args.workers,
+                       suffix=args.suffix, fmt=args.fmt.split(",") if args.fmt else None,
+                       resume=not args.no_resume, progress=progress, tiled=args.tiled,
+                       backend=args.backend, preset=args.preset,
+                       max_sizes=[int(v) for v in args.max_size.split(",")], cache=cache,
+                       metadata=not args.strip_metadata)
+    print(file=sys.stderr)
+    print(report.summary())
+    for input_path, error in report.failed:
+        print(f"FAILED {input_path}: {error}", file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
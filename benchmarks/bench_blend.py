@@ -0,0 +1,101 @@
+"""Compare the Pillow and NumPy blend backends.
+
+    python benchmarks/bench_blend.py [--size 6000x4000] [--repeat 20] [--stack 16]
+    python benchmarks/bench_blend.py --check
+
+--check compares the two backends' output instead of timing them, for every
+position and native mode over a gradient, and fails if any pixel differs by
+more than 1 LSB.
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops
+
+import blend
+from watermark import POSITIONS, WatermarkSpec, add_watermark, watermark_placement, composite_tile
+
+CHECK_COLORS = ("#ffffff", "#000000", "#00ff00", "#ff0000", "#0000ff", "#7f3fbf")
+CHECK_OPACITIES = (0.3, 0.7, 1.0)
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def max_difference(first, second):
+    """Largest per-channel difference between two same-sized images"""
+    extrema = ImageChops.difference(first, second).getextrema()
+    if first.mode == "L":
+        extrema = (extrema,)
+    return max(high for _, high in extrema)
+
+
+def check(size):
+    """Compare the backends for every mode, position and colour; return the worst difference"""
+    worst = 0
+    gradient = Image.linear_gradient("L").resize(size)
+    for mode in blend.NATIVE_MODES:
+        image = gradient if mode == "L" else Image.merge("RGB", (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT),
+                                                                 gradient.transpose(Image.ROTATE_180)))
+        for position in POSITIONS:
+            for color, opacity in itertools.product(CHECK_COLORS, CHECK_OPACITIES):
+                spec = WatermarkSpec(text="© Dabeey 2025", font_size=90, color=color, opacity=opacity,
+                                     position=position, offset_x=37, offset_y=41)
+                difference = max_difference(add_watermark(image, spec),
+                                            add_watermark(image, spec, backend="numpy"))
+                if difference > 1:
+                    print(f"{mode:4} {position:14} {color} at {opacity}: differs by {difference}")
+                worst = max(worst, difference)
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="6000x4000")
+    parser.add_argument("--font-size", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--stack", type=int, default=16, help="Images per blend_batch call")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare the backends' output (at 600x300) instead of timing them")
+    args = parser.parse_args(argv)
+
+    if not blend.HAVE_NUMPY:
+        sys.exit("numpy is not installed")
+    if args.check:
+        worst = check((600, 300))
+        print(f"largest difference between the backends: {worst} LSB")
+        sys.exit(1 if worst > 1 else 0)
+
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    spec = WatermarkSpec(text="© Dabeey 2025", font_size=args.font_size, position="Center")
+    tile, (x, y) = watermark_placement(spec, size)
+    print(f"{size[0]}x{size[1]}, tile {tile.width}x{tile.height}, best of {args.repeat}")
+
+    print(f"{'mode':6} {'pillow ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for mode in ("RGB", "L", "RGBA"):
+        image = Image.new(mode, size, 128)
+        pillow = best_of(args.repeat, lambda: add_watermark(image, spec, in_place=True))
+        numpy = best_of(args.repeat, lambda: add_watermark(image, spec, in_place=True, backend="numpy"))
+        print(f"{mode:6} {pillow * 1000:10.3f} {numpy * 1000:10.3f} {pillow / numpy:7.2f}x")
+
+    images = [Image.new("RGB", size, 128) for _ in range(args.stack)]
+    one_by_one = best_of(args.repeat, lambda: [composite_tile(im, tile, x, y) for im in images])
+    batched = best_of(args.repeat, lambda: blend.blend_batch(images, tile, x, y))
+    print(f"\n{args.stack} RGB images: pillow one-by-one {one_by_one * 1000:.3f} ms, "
+          f"numpy blend_batch {batched * 1000:.3f} ms ({one_by_one / batched:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
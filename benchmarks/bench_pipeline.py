@@ -0,0 +1,261 @@
+"""Benchmark the load, preview, apply, display and save stages across image sizes and modes.
+
+    python benchmarks/bench_pipeline.py --quick
+    python benchmarks/bench_pipeline.py --sizes 1,12,50,100 --output results.json
+    python benchmarks/bench_pipeline.py --quick --compare results.json
+
+Synthetic images are generated once into a cache directory. Each
+(size, mode, source format) case runs in a fresh process so its peak RSS
+is measured in isolation. Results are written as JSON; --compare flags
+stages whose median got slower than in a previous run by more than
+--threshold and by more than --noise-floor milliseconds, so sub-millisecond
+stages don't fail on scheduling jitter.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from PIL import Image
+
+from export import write_image
+from loader import open_image, preview_proxy
+from watermark import WatermarkSpec, add_watermark
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [1, 4, 12, 24, 50, 100]
+DEFAULT_MODES = ["RGB", "RGBA", "L", "P"]
+DEFAULT_POSITIONS = ["Bottom Right", "Center"]
+DEFAULT_FONT_SIZES = [36, 120]
+DEFAULT_SAVE_FORMATS = ["png", "jpg", "webp"]
+DEFAULT_REPEAT = 3
+# Repeats per stage when comparing, so medians aren't single noisy samples
+COMPARE_REPEAT = 5
+CANVAS_SIZE = (800, 650)
+
+# Synthetic inputs beyond Pillow's decompression-bomb limit are intended here
+Image.MAX_IMAGE_PIXELS = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def dimensions(megapixels):
+    # 3:2, like most camera sensors
+    width = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    return width, int(width / 1.5)
+
+
+def fit(size, bounds):
+    ratio = min(bounds[0] / size[0], bounds[1] / size[1])
+    return max(1, int(size[0] * ratio)), max(1, int(size[1] * ratio))
+
+
+def source_formats(mode):
+    return ["jpg", "png"] if mode in ("RGB", "L") else ["png"]
+
+
+def synthetic_image(cache_dir, megapixels, mode, fmt):
+    """Create (or reuse) a noisy gradient test image so encoders have real work to do"""
+    path = os.path.join(cache_dir, f"synthetic_{megapixels}mp_{mode}.{fmt}")
+    if os.path.exists(path):
+        return path
+    size = dimensions(megapixels)
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 24)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    if mode == "P":
+        image = image.quantize(64)
+    elif mode == "RGBA":
+        image.putalpha(noise)
+    else:
+        image = image.convert(mode)
+    if fmt == "jpg":
+        image.save(path, quality=90)
+    else:
+        image.save(path)
+    return path
+
+
+def timed(repeat, func):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, {"best_ms": min(timings) * 1000, "median_ms": statistics.median(timings) * 1000}
+
+
+def run_case(case):
+    """Time every stage for one source image; runs in its own process"""
+    path, repeat, positions, font_sizes, save_formats, out_dir = (
+        case["path"], case["repeat"], case["positions"], case["font_sizes"],
+        case["save_formats"], case["out_dir"])
+    records = []
+
+    def record(stage, stats, **extra):
+        records.append(dict(case["labels"], stage=stage, **stats, **extra))
+
+    def load():
+        image = open_image(path)
+        image.load()
+        return image
+
+    original, stats = timed(repeat, load)
+    record("load", stats)
+
+    canvas_size = fit(original.size, CANVAS_SIZE)
+    _, stats = timed(repeat, lambda: preview_proxy(open_image(path), canvas_size))
+    record("preview_proxy", stats)
+    proxy = preview_proxy(open_image(path), canvas_size)
+    scale = proxy.width / original.width
+
+    applied = None
+    for position in positions:
+        for font_size in font_sizes:
+            spec = WatermarkSpec(position=position, font_size=font_size)
+            _, stats = timed(repeat, lambda: add_watermark(proxy, spec.scaled(scale)))
+            record("preview", stats, position=position, font_size=font_size)
+            applied, stats = timed(repeat, lambda: add_watermark(original.copy(), spec, in_place=True))
+            record("apply", stats, position=position, font_size=font_size)
+
+    _, stats = timed(repeat, lambda: applied.resize(canvas_size, Image.LANCZOS, reducing_gap=3.0))
+    record("display", stats)
+
+    for fmt in save_formats:
+        target = os.path.join(out_dir, f"bench_{os.getpid()}.{fmt}")
+        _, stats = timed(repeat, lambda: write_image(applied, target))
+        record("save", stats, save_format=fmt, bytes=os.path.getsize(target))
+        os.remove(target)
+
+    rss = peak_rss_mb()
+    for entry in records:
+        entry["peak_rss_mb"] = rss
+    return records
+
+
+def compare(results, baseline_path, threshold, noise_floor_ms=0.0):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def key(entry):
+        return tuple(entry.get(k) for k in ("megapixels", "mode", "source_format", "stage",
+                                           "position", "font_size", "save_format"))
+
+    previous = {key(entry): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get(key(entry))
+        if before is None:
+            continue
+        now, then = entry["median_ms"], before.get("median_ms", before["best_ms"])
+        if now > then * (1 + threshold) and now - then > noise_floor_ms:
+            regressions.append((entry, before))
+    return regressions
+
+
+def describe(entry):
+    parts = [f"{entry['megapixels']}MP", entry["mode"], entry["source_format"], entry["stage"]]
+    parts += [str(entry[k]) for k in ("position", "font_size", "save_format") if k in entry]
+    return " ".join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AquaMark Pro pipeline benchmark")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated megapixel counts")
+    parser.add_argument("--modes", default=",".join(DEFAULT_MODES))
+    parser.add_argument("--positions", default=",".join(DEFAULT_POSITIONS))
+    parser.add_argument("--font-sizes", default=",".join(map(str, DEFAULT_FONT_SIZES)))
+    parser.add_argument("--save-formats", default=",".join(DEFAULT_SAVE_FORMATS))
+    parser.add_argument("--repeat", type=int,
+                        help=f"Runs per stage (default: {DEFAULT_REPEAT}, or {COMPARE_REPEAT} with --compare)")
+    parser.add_argument("--quick", action="store_true",
+                        help="1 and 12 MP, RGB and RGBA only")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "aquamark-bench"))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Fractional slowdown that counts as a regression")
+    parser.add_argument("--noise-floor", type=float, default=2.0, metavar="MS",
+                        help="Slowdowns smaller than this many milliseconds are never regressions")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes, args.modes = "1,12", "RGB,RGBA"
+    if args.repeat is None:
+        # Never single runs: a quick run is often the baseline for the next --compare
+        args.repeat = COMPARE_REPEAT if args.compare else DEFAULT_REPEAT
+
+    sizes = [float(v) if "." in v else int(v) for v in args.sizes.split(",")]
+    modes = args.modes.split(",")
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    cases = []
+    for megapixels in sizes:
+        for mode in modes:
+            for fmt in source_formats(mode):
+                cases.append({
+                    "path": synthetic_image(args.cache_dir, megapixels, mode, fmt),
+                    "labels": {"megapixels": megapixels, "mode": mode, "source_format": fmt},
+                    "repeat": args.repeat,
+                    "positions": args.positions.split(","),
+                    "font_sizes": [int(v) for v in args.font_sizes.split(",")],
+                    "save_formats": args.save_formats.split(","),
+                    "out_dir": args.cache_dir,
+                })
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        # A fresh single-use process per case keeps peak RSS figures independent
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            records = pool.apply(run_case, (case,))
+        results.extend(records)
+        for entry in records:
+            print(f"{describe(entry):55} {entry['median_ms']:10.2f} ms  "
+                  f"peak {entry['peak_rss_mb'] or 0:8.1f} MB")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold, args.noise_floor)
+        for entry, before in regressions:
+            then = before.get("median_ms", before["best_ms"])
+            print(f"REGRESSION {describe(entry)}: {then:.2f} -> {entry['median_ms']:.2f} ms (median)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
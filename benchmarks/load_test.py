@@ -0,0 +1,114 @@
+"""Load-test the local watermarking server and report latency percentiles.
+
+    python server.py -j 4 &
+    python benchmarks/load_test.py --requests 500 --concurrency 32
+    python benchmarks/load_test.py --specs 4 --megapixels 12 --format webp
+
+Each of --concurrency clients keeps one connection open and sends requests
+back to back. --specs spreads them over several watermark texts, to see how
+batching behaves when requests don't all share a spec. 503 responses
+(backpressure) are counted separately from errors.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import sys
+import time
+from PIL import Image
+
+
+def synthetic_upload(megapixels, fmt):
+    width = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    size = (width, int(width / 1.5))
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 24)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    out = io.BytesIO()
+    image.save(out, format=fmt, quality=90)
+    return out.getvalue()
+
+
+async def request(reader, writer, method, target, host, body=b""):
+    writer.write((f"{method} {target} HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(args, upload, targets, latencies, outcomes):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        while targets:
+            target = targets.pop()
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, "POST", target, args.host, upload)
+            elapsed = time.perf_counter() - start
+            if status == 200:
+                latencies.append(elapsed)
+            outcomes[status] = outcomes.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run(args):
+    upload = synthetic_upload(args.megapixels, "JPEG")
+    query = f"format={args.format}&position=Bottom%20Right"
+    targets = [f"/watermark?{query}&text=Load%20test%20{i % args.specs}" for i in range(args.requests)]
+    latencies, outcomes = [], {}
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args, upload, targets, latencies, outcomes)
+                           for _ in range(args.concurrency)))
+    wall = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, body = await request(reader, writer, "GET", "/stats", args.host)
+    writer.close()
+    return latencies, outcomes, wall, json.loads(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AquaMark Pro server load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--specs", type=int, default=1, help="Distinct watermark texts to rotate through")
+    parser.add_argument("--megapixels", type=float, default=2)
+    parser.add_argument("--format", default="jpeg", help="Output format to request")
+    args = parser.parse_args(argv)
+
+    latencies, outcomes, wall, stats = asyncio.run(run(args))
+    if not latencies:
+        print(f"No successful requests: {outcomes}")
+        return 1
+    print(f"{len(latencies)} ok in {wall:.2f}s ({len(latencies) / wall:.1f} req/s), "
+          f"status counts {dict(sorted(outcomes.items()))}")
+    print(f"latency p50 {percentile(latencies, 0.50) * 1000:.1f} ms  "
+          f"p90 {percentile(latencies, 0.90) * 1000:.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"server: {stats['batches']} batches, mean batch {stats['mean_batch']:.2f}, "
+          f"{stats['rejected']} rejected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
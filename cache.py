@@ -0,0 +1,181 @@
+"""AquaMark Pro - content-addressed cache of watermarked outputs
+
+Each output is stored under a key hashed from the source file's bytes, the
+WatermarkSpec and the export settings, so an unchanged image with unchanged
+settings is copied out of the cache instead of being decoded, composited and
+encoded again. A JSON index records entry sizes in least-recently-used order
+and remembers each source's digest against its size and mtime, so unchanged
+sources are not even re-read. The cache is trimmed to max_bytes by evicting
+the least recently used entries, and only the digests of sources that still
+back an entry are kept.
+
+An OutputCache is not safe to share between processes; batch.py keeps it in
+the parent and lets the workers do only the rendering.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from dataclasses import asdict
+
+INDEX_NAME = "index.json"
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+_CHUNK = 1 << 20
+
+
+def _atomic_copy(source, dest):
+    # Copy to a temporary name beside dest and rename, so readers never see a partial file
+    directory = os.path.dirname(os.path.abspath(dest))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".aquamark-", suffix=".part")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        shutil.copymode(source, tmp_path)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class OutputCache:
+    """On-disk, size-capped LRU cache of rendered output files"""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.entries = OrderedDict()   # key -> size in bytes, least recently used first
+        self.sources = {}              # abspath -> [size, mtime_ns, digest]
+        self.origins = {}              # key -> abspath of the source last rendered or served for it
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != CACHE_VERSION:
+            return
+        self.entries = OrderedDict(index.get("entries", []))
+        self.sources = index.get("sources", {})
+        self.origins = {key: path for key, path in index.get("origins", {}).items() if key in self.entries}
+        self.total_bytes = sum(self.entries.values())
+
+    def save(self):
+        """Write the index; call once after a run rather than after every entry"""
+        # Digests of sources no cached output came from would only accumulate
+        live = set(self.origins.values())
+        self.sources = {path: known for path, known in self.sources.items() if path in live}
+        index = {"version": CACHE_VERSION, "entries": list(self.entries.items()), "sources": self.sources,
+                 "origins": self.origins}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".index-", suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def source_digest(self, path):
+        """SHA-256 of the file at path, reused while its size and mtime are unchanged"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.sources.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                digest.update(chunk)
+        self.sources[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def key(self, source_path, spec, target, **settings):
+        """Cache key for rendering source_path with spec into an ExportTarget.
+
+        settings holds anything else that changes the output bytes (blend
+        backend, tiled mode, ...).
+        """
+        payload = {
+            "source": self.source_digest(source_path),
+            "spec": asdict(spec),
+            "format": target.format,
+            "preset": target.preset,
+            "max_size": target.max_size,
+            "options": [list(option) for option in target.options],
+            "metadata": target.metadata,
+            "settings": settings,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def __contains__(self, key):
+        return key in self.entries and os.path.exists(self._path(key))
+
+    def fetch(self, key, dest, origin=None):
+        """Copy the cached output for key to dest; returns False on a miss.
+
+        origin is the source path the key was computed from, so its digest
+        stays remembered while the entry lives.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return False
+        try:
+            _atomic_copy(self._path(key), dest)
+        except FileNotFoundError:
+            # Removed behind our back; forget it
+            self._forget(key)
+            self.misses += 1
+            return False
+        self.entries.move_to_end(key)
+        if origin:
+            self.origins[key] = os.path.abspath(origin)
+        self.hits += 1
+        return True
+
+    def store(self, key, source, origin=None):
+        """Add the file at source under key, rendered from origin, then evict down to max_bytes"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_copy(source, path)
+        size = os.path.getsize(path)
+        self.total_bytes += size - self.entries.pop(key, 0)
+        self.entries[key] = size
+        if origin:
+            self.origins[key] = os.path.abspath(origin)
+        self._evict()
+
+    def _forget(self, key):
+        self.total_bytes -= self.entries.pop(key)
+        self.origins.pop(key, None)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self._forget(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for key in list(self.entries):
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        self.entries.clear()
+        self.sources.clear()
+        self.origins.clear()
+        self.total_bytes = 0
+        self.save()
@@ -0,0 +1,235 @@
+"""AquaMark Pro - export stage: format presets, atomic writes and background encoding"""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from PIL import Image, JpegImagePlugin, PngImagePlugin
+
+from profiling import instrumentation, stage
+from loader import ORIENTATION_TAG
+from animation import Animation, MULTIFRAME_FORMATS
+
+# Encoder options per format. "balanced" matches what AquaMark has always written.
+# "keep" re-encodes a JPEG source with its own quantisation tables and subsampling
+# (see source_jpeg_options) and is "balanced" for everything else.
+FORMAT_PRESETS = {
+    "PNG": {
+        "fast": {"compress_level": 1},
+        "balanced": {},
+        "small": {"compress_level": 9, "optimize": True},
+        "keep": {},
+    },
+    "JPEG": {
+        "fast": {"quality": 90, "subsampling": "4:2:0"},
+        "balanced": {"quality": 95},
+        "small": {"quality": 85, "optimize": True, "progressive": True},
+        "keep": {"quality": 95},
+    },
+    "WEBP": {
+        "fast": {"quality": 90, "method": 0},
+        "balanced": {"quality": 95},
+        "small": {"quality": 85, "method": 6},
+        "keep": {"quality": 95},
+    },
+}
+PRESETS = ("fast", "balanced", "small", "keep")
+
+# Formats whose Pillow encoders accept each piece of metadata
+METADATA_FORMATS = {
+    "exif": ("JPEG", "PNG", "WEBP", "TIFF"),
+    "icc_profile": ("JPEG", "PNG", "WEBP", "TIFF"),
+    "xmp": ("JPEG", "PNG", "WEBP"),
+}
+
+# mkstemp creates files as 0600; outputs should get the usual umask-based permissions
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+@dataclass(frozen=True)
+class ExportTarget:
+    """One output file: where it goes, how hard to compress it and an optional size cap"""
+    path: str
+    preset: str = "balanced"
+    max_size: int = 0
+    options: tuple = ()
+    metadata: bool = True
+
+    @property
+    def format(self):
+        return format_for_path(self.path)
+
+
+def format_for_path(path):
+    fmt = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unknown image format for {os.path.basename(path)}")
+    return fmt
+
+
+def source_jpeg_options(source):
+    """Quantisation tables and subsampling of a JPEG source, to re-encode it with the same ones.
+
+    Re-quantising with the source's own tables leaves most 8x8 blocks away
+    from the watermark unchanged, instead of adding a generation of loss to
+    the whole frame, and keeps the file size in line with the original.
+    Returns {} if source isn't a JPEG opened from a file.
+    """
+    if getattr(source, "format", None) != "JPEG" or not getattr(source, "quantization", None):
+        return {}
+    options = {"qtables": source.quantization}
+    sampling = JpegImagePlugin.get_sampling(source)
+    if sampling != -1:
+        options["subsampling"] = sampling
+    return options
+
+
+def encoder_options(fmt, preset="balanced", overrides=(), source=None):
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preset {preset!r}, expected one of {', '.join(PRESETS)}")
+    options = dict(FORMAT_PRESETS.get(fmt, {}).get(preset, {}))
+    if preset == "keep" and fmt == "JPEG":
+        tables = source_jpeg_options(source)
+        if tables:
+            # Pillow scales custom tables by quality, so leave it unset to use them as they are
+            options.pop("quality", None)
+            options.update(tables)
+    options.update(dict(overrides))
+    return options
+
+
+def _upright_exif(data):
+    # Outputs are written upright (see loader.apply_orientation), so the orientation tag must go
+    exif = Image.Exif()
+    exif.load(data)
+    if exif.get(ORIENTATION_TAG, 1) == 1:
+        return data
+    del exif[ORIENTATION_TAG]
+    return exif.tobytes()
+
+
+def metadata_options(info, fmt):
+    """Save options that carry EXIF, ICC profile and XMP from an image's info over to fmt"""
+    options = {}
+    if info.get("exif") and fmt in METADATA_FORMATS["exif"]:
+        options["exif"] = _upright_exif(info["exif"])
+    if info.get("icc_profile") and fmt in METADATA_FORMATS["icc_profile"]:
+        options["icc_profile"] = info["icc_profile"]
+    xmp = info.get("xmp")
+    if xmp and fmt in METADATA_FORMATS["xmp"]:
+        if fmt == "PNG":
+            # The PNG encoder only writes XMP as an iTXt chunk
+            pnginfo = PngImagePlugin.PngInfo()
+            pnginfo.add_itxt("XML:com.adobe.xmp", xmp.decode("utf-8", "replace") if isinstance(xmp, bytes) else xmp)
+            options["pnginfo"] = pnginfo
+        else:
+            options["xmp"] = xmp
+    return options
+
+
+def encode_image(image, fp, fmt, preset="balanced", options=(), metadata=True, source=None):
+    """Encode image, or every frame of an Animation, to the open file fp.
+
+    source is the image as loaded (default: image itself); its metadata is
+    carried over when metadata is True, and the "keep" preset reuses its
+    JPEG tables. Formats holding a single frame get an Animation's first.
+    """
+    if isinstance(image, Animation):
+        if fmt not in MULTIFRAME_FORMATS:
+            image = image.frames[0]
+        elif source is None:
+            source = image.frames[0]
+    source = image if source is None else source
+    # Some encoders fall back to image.info["icc_profile"], so stripping has to blank it explicitly
+    save_options = metadata_options(source.info, fmt) if metadata else {"icc_profile": None}
+    save_options.update(encoder_options(fmt, preset, options, source))
+    if isinstance(image, Animation):
+        frames = [prepare_for_format(frame, fmt) for frame in image.frames]
+        save_options.update(image.save_options(fmt), save_all=True, append_images=frames[1:])
+        frames[0].save(fp, format=fmt, **save_options)
+    else:
+        prepare_for_format(image, fmt).save(fp, format=fmt, **save_options)
+
+
+def prepare_for_format(image, fmt):
+    """Convert image to a mode the encoder accepts, only when it has to"""
+    if fmt == "JPEG" and image.mode not in ("RGB", "L", "CMYK"):
+        return image.convert("RGB")
+    if fmt == "WEBP" and image.mode not in ("RGB", "RGBA"):
+        return image.convert("RGBA" if "A" in image.mode or "transparency" in image.info else "RGB")
+    return image
+
+
+def resize_to_fit(image, max_size):
+    if not max_size or max(image.size) <= max_size:
+        return image
+    if isinstance(image, Animation):
+        return image.map(lambda frame: resize_to_fit(frame, max_size))
+    ratio = max_size / max(image.size)
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def write_image(image, path, fmt=None, preset="balanced", options=(), metadata=True, source=None):
+    """Encode image to a temporary file next to path and rename it into place.
+
+    Readers never see a half-written file, and a failed encode leaves any
+    existing file at path untouched. metadata and source are as for
+    encode_image.
+    """
+    fmt = fmt or format_for_path(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".aquamark-", suffix=".part")
+    try:
+        # Readable too: the multi-page TIFF writer reads back what it has written
+        with os.fdopen(fd, "w+b") as fp, stage("encode"):
+            encode_image(image, fp, fmt, preset, options, metadata, source)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def export_target(image, target, source=None):
+    return write_image(resize_to_fit(image, target.max_size), target.path,
+                       target.format, target.preset, target.options, target.metadata, source)
+
+
+def export_all(image, targets, source=None):
+    """Write several formats/sizes from one decoded image, encoding them in parallel.
+
+    Pillow's encoders release the GIL, so threads are enough. source is the
+    image as loaded, for its metadata and JPEG tables, when image is a
+    watermarked copy of it. image may also be an Animation. Returns the
+    written paths in target order.
+    """
+    if not isinstance(image, Animation):
+        image.load()
+    if len(targets) == 1:
+        return [export_target(image, targets[0], source)]
+    with ThreadPoolExecutor(max_workers=min(len(targets), os.cpu_count() or 1)) as pool:
+        return list(pool.map(lambda target: export_target(image, target, source), targets))
+
+
+class Exporter:
+    """Runs exports on a background thread pool so the UI thread never encodes"""
+
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix="aquamark-export")
+
+    def submit(self, image, targets, source=None):
+        """Start exporting image to targets; returns a Future of the written paths"""
+        return self.run(export_all, image, list(targets), source)
+
+    def run(self, func, *args):
+        """Run func(*args) on the export threads, e.g. to render before exporting; returns its Future"""
+        return self.executor.submit(instrumentation.run_profiled, func, *args)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
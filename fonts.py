@@ -0,0 +1,120 @@
+"""AquaMark Pro - font resolution and rendered-text caches"""
+
+import os
+import sys
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+from profiling import stage
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+# Metric-compatible stand-ins, tried in order when the family itself isn't installed
+FONT_ALIASES = {
+    "Arial": ["arial", "arialmt", "liberationsans", "arimo", "dejavusans"],
+    "Helvetica": ["helvetica", "helveticaneue", "nimbussans", "liberationsans", "arial", "dejavusans"],
+    "Times New Roman": ["timesnewroman", "times", "liberationserif", "tinos", "dejavuserif"],
+    "Courier New": ["couriernew", "cour", "courier", "liberationmono", "cousine", "dejavusansmono"],
+    "Verdana": ["verdana", "dejavusans"],
+    "Georgia": ["georgia", "gelasio", "dejavuserif"],
+    "Palatino": ["palatino", "palatinolinotype", "pala", "p052", "urwpalladio", "dejavuserif"],
+}
+
+MASK_CACHE_SIZE = 256
+TILE_CACHE_SIZE = 64
+
+
+def font_directories():
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        local = os.environ.get("LOCALAPPDATA", os.path.join(home, "AppData", "Local"))
+        return [os.path.join(windir, "Fonts"),
+                os.path.join(local, "Microsoft", "Windows", "Fonts")]
+    if sys.platform == "darwin":
+        return ["/System/Library/Fonts", "/System/Library/Fonts/Supplemental",
+                "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    data_dirs = os.environ.get("XDG_DATA_DIRS", "/usr/local/share:/usr/share").split(":")
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.join(home, ".local", "share"))
+    return ([os.path.join(d, "fonts") for d in [data_home] + data_dirs]
+            + [os.path.join(home, ".fonts")])
+
+
+def _normalise(name):
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+@lru_cache(maxsize=None)
+def font_index():
+    """Map normalised font file stems to paths, scanning the system font folders once"""
+    index = {}
+    for directory in font_directories():
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                stem, ext = os.path.splitext(filename)
+                if ext.lower() in FONT_EXTENSIONS:
+                    index.setdefault(_normalise(stem), os.path.join(dirpath, filename))
+    return index
+
+
+@lru_cache(maxsize=None)
+def resolve_font_path(family):
+    """Return the font file for a family name such as "Times New Roman", or None"""
+    index = font_index()
+    for candidate in [family] + FONT_ALIASES.get(family, []):
+        candidate = _normalise(candidate)
+        for key in (candidate, candidate + "regular", candidate + "mt"):
+            if key in index:
+                return index[key]
+    return None
+
+
+@lru_cache(maxsize=64)
+def get_font(family, size):
+    """Load the font for (family, size) once and reuse it for every later render"""
+    path = resolve_font_path(family)
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except (OSError, IOError):
+            pass
+    # Let Pillow search its own locations, as earlier versions did
+    for filename in (family + ".ttf", "arial.ttf"):
+        try:
+            return ImageFont.truetype(filename, size)
+        except (OSError, IOError):
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def text_mask(text, family, size):
+    """Rasterise text into an "L" coverage mask cropped to its ink bounding box.
+
+    Returns the mask and the (left, top) offset of its corner relative to the
+    point the text is drawn at. Callers must not modify the returned mask.
+    """
+    font = get_font(family, size)
+    with stage("rasterise"):
+        left, top, right, bottom = font.getbbox(text)
+        mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+    return mask, (left, top)
+
+
+@lru_cache(maxsize=TILE_CACHE_SIZE)
+def text_tile(text, family, size, fill):
+    """Colour a cached text mask with an RGBA fill, matching ImageDraw.text output exactly"""
+    mask, offset = text_mask(text, family, size)
+    tile = Image.new("RGBA", mask.size, (0, 0, 0, 0))
+    tile.paste(fill, (0, 0) + mask.size, mask)
+    return tile, offset
+
+
+def clear_caches():
+    for cached in (text_tile, text_mask, get_font, resolve_font_path, font_index):
+        cached.cache_clear()
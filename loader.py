@@ -0,0 +1,88 @@
+"""AquaMark Pro - lazy image loading and reduced-resolution preview decoding"""
+
+from PIL import Image, ImageOps
+
+from profiling import stage
+
+
+ORIENTATION_TAG = 0x0112
+# Formats whose Pillow plugin reports the upright size and transposes on load itself
+SELF_ORIENTING_FORMATS = ("TIFF",)
+# Orientations that turn the image by 90 degrees, swapping width and height
+SWAPPED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def orientation(image):
+    """EXIF orientation of image (1 is upright), read from its header without decoding pixels.
+
+    Image.getexif() is avoided because for PNGs without EXIF in the header
+    it decodes the whole image looking for a later chunk. TIFFs count as
+    upright: Pillow already turns them while loading, though their tag
+    still holds the stored orientation.
+    """
+    if image.format in SELF_ORIENTING_FORMATS:
+        return 1
+    data = image.info.get("exif")
+    if not data:
+        return 1
+    exif = Image.Exif()
+    exif.load(data)
+    return exif.get(ORIENTATION_TAG, 1)
+
+
+def oriented_size(image):
+    """(width, height) of image once turned upright, without decoding it"""
+    if orientation(image) in SWAPPED_ORIENTATIONS:
+        return image.height, image.width
+    return image.size
+
+
+def apply_orientation(image):
+    """Return image turned upright according to its EXIF orientation.
+
+    Images that are already upright are returned as they are, still lazy;
+    the others are decoded and transposed, and the orientation tag is
+    dropped from their EXIF so it isn't applied twice.
+    """
+    if orientation(image) == 1:
+        return image
+    return ImageOps.exif_transpose(image)
+
+
+def open_image(path):
+    """Open an image without decoding its pixels.
+
+    Only the header is read, so width, height and mode are available at once;
+    the full-resolution decode happens the first time pixels are needed
+    (e.g. on apply or export). The handle is as stored: use oriented_size()
+    for its upright dimensions and apply_orientation() once it is decoded.
+    """
+    return Image.open(path)
+
+
+def load_preview(path, size):
+    """Decode the image at path straight to roughly size and return it, upright, resized to exactly size.
+
+    JPEGs are decoded with draft mode, which lets libjpeg scale by 1/2, 1/4 or
+    1/8 during decoding, so a 100 MP file never gets decoded at full size.
+    Other formats are decoded normally and shrunk with reduce() before the
+    final LANCZOS pass. The EXIF orientation is applied to the small result.
+    """
+    with Image.open(path) as image:
+        stored_size = size[::-1] if orientation(image) in SWAPPED_ORIENTATIONS else size
+        if image.format == "JPEG":
+            image.draft(image.mode, stored_size)
+        return apply_orientation(image.resize(stored_size, Image.LANCZOS, reducing_gap=3.0))
+
+
+def preview_proxy(image, size):
+    """Return a size-sized proxy of image, decoding from its file when it has one.
+
+    Going back to the file also keeps preview threads from touching (and
+    lazily loading) the shared image object while the UI thread uses it.
+    """
+    with stage("proxy"):
+        path = getattr(image, "filename", "")
+        if path:
+            return load_preview(path, size)
+        return apply_orientation(image).resize(size, Image.LANCZOS, reducing_gap=3.0)
@@ -0,0 +1,61 @@
+"""AquaMark Pro - decoded and pre-scaled logo caches
+
+A logo is decoded once and kept premultiplied ("RGBa"), which is the form
+resampling needs to avoid dark fringes around transparent edges. Each target
+width is then resized, converted back to straight RGBA with the opacity
+applied, and kept in an LRU, so a batch of mixed-resolution photos decodes
+the logo once and resizes it once per distinct width.
+"""
+
+import os
+from functools import lru_cache
+from PIL import Image
+
+LOGO_CACHE_SIZE = 8
+SCALED_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=LOGO_CACHE_SIZE)
+def _decode(path, mtime_ns):
+    with Image.open(path) as logo:
+        return logo.convert("RGBA").convert("RGBa")
+
+
+def _version(path):
+    # (absolute path, mtime) identifies a logo, so editing the file invalidates its cache entries
+    return os.path.abspath(path), os.stat(path).st_mtime_ns
+
+
+def load_logo(path):
+    """Return the premultiplied logo at path; it is decoded again only if the file changes"""
+    return _decode(*_version(path))
+
+
+def logo_width(scale, image_size):
+    """Logo width for an image of image_size, scale being the fraction of the image width"""
+    return max(1, round(image_size[0] * scale))
+
+
+@lru_cache(maxsize=SCALED_CACHE_SIZE)
+def _scaled(path, mtime_ns, width, opacity):
+    logo = _decode(path, mtime_ns)
+    height = max(1, round(logo.height * width / logo.width))
+    if (width, height) != logo.size:
+        logo = logo.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+    tile = logo.convert("RGBA")
+    if opacity < 1:
+        tile.putalpha(tile.getchannel("A").point(lambda a: int(a * opacity)))
+    return tile
+
+
+def logo_tile(path, width, opacity):
+    """The logo at path resized to width and ready to blend: straight RGBA, alpha x opacity.
+
+    Callers must not modify the returned tile.
+    """
+    return _scaled(*_version(path), width, float(opacity))
+
+
+def clear_caches():
+    for cached in (_scaled, _decode):
+        cached.cache_clear()
@@ -1,9 +1,28 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from tkinter import colorchooser
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+from tkinter import colorchooser, simpledialog
+from PIL import Image, ImageTk
 import os
-from collections import deque
+from collections import deque, OrderedDict
+from watermark import WatermarkSpec, POSITIONS, add_watermark, watermark_placement, compile_plan
+from scheduler import PreviewScheduler
+from loader import open_image, oriented_size, apply_orientation, preview_proxy
+from export import Exporter, ExportTarget, PRESETS, export_all
+from profiling import instrumentation, stage
+from presets import load_presets, save_presets
+from logos import load_logo
+from animation import is_animated, read_animation, watermark_animation
+
+# Stages shown on the F2 timing overlay, in pipeline order
+STATS_STAGES = ("proxy", "composite", "preview", "display", "apply", "encode")
+
+
+def export_animation(path, spec, target):
+    # Runs on an export thread, with its own handle so the UI's original_image is never seeked
+    with Image.open(path) as source:
+        animation = watermark_animation(read_animation(source), compile_plan(spec), in_place=True)
+        return export_all(animation, [target], source=source)
+
 
 class WatermarkApp:
     """AquaMark Pro - Professional Watermarking Tool by Dabeey 2025"""
@@ -28,7 +47,12 @@ class WatermarkApp:
         # Variables
         self.image_path = ""
         self.original_image = None
+        # Upright (width, height) of original_image, which stays a lazy, unrotated file handle
+        self.image_size = None
         self.current_image = None
+        # Animated and multi-page originals show their first frame; every frame is read on save
+        self.animated = False
+        self.preview_proxy = None
         self.watermark_text = self.watermark_signature
         self.watermark_text = "Your Watermark"
         self.watermark_color = "#FFFFFF"
@@ -37,20 +61,48 @@ class WatermarkApp:
         self.position = "Bottom Right"
         self.offset_x = 0
         self.offset_y = 0
+        # Set from presets, which can place the watermark further from the edges than the default
+        self.margin = WatermarkSpec.margin
+        # Pattern settings for the "Tiled" position; set from presets
+        self.angle = WatermarkSpec.angle
+        self.tile_gap = WatermarkSpec.tile_gap
+        self.logo_path = ""
+        self.logo_scale = WatermarkSpec.logo_scale
         self.drag_data = {"x": 0, "y": 0, "item": None}
-        
-        # Undo/Redo stacks
-        self.undo_stack = deque(maxlen=10)
-        self.redo_stack = deque(maxlen=10)
+        self.show_stats = False
+        self.synced_slider_values = None
+        
+        # Undo/Redo stacks hold the WatermarkSpec that produced each state (None for
+        # the unwatermarked original); images are re-rendered from original_image on demand
+        self.history_depth = 100
+        self.undo_stack = deque(maxlen=self.history_depth)
+        self.redo_stack = deque(maxlen=self.history_depth)
+        self.applied_spec = None
+        self.frame_cache = OrderedDict()
+        self.frame_cache_size = 3
         
         # Font settings
         self.font_family = "Arial"
         self.available_fonts = ["Arial", "Helvetica", "Times New Roman", "Courier New", "Verdana", "Georgia", "Palatino"]
         
+        # Named watermark presets from config.ini
+        try:
+            self.watermark_presets = load_presets()
+        except Exception as e:
+            messagebox.showwarning("Warning", f"Could not read watermark presets: {str(e)}")
+            self.watermark_presets = {}
+        
         # Create UI
         self.create_widgets()
         self.setup_modern_ui()
         
+        # Previews render on a background thread; only the latest request is drawn
+        self.preview_scheduler = PreviewScheduler(self.root, self.render_preview, self.display_image,
+                                                  on_error=self.preview_failed)
+        
+        # Encoding happens on background threads too
+        self.exporter = Exporter()
+        
     def create_widgets(self):
         # Main container
         self.main_container = tk.Frame(self.root, bg=self.bg_color)
@@ -76,6 +128,18 @@ class WatermarkApp:
         self.redo_btn = self.create_tool_button("↪ Redo", self.redo_action, self.toolbar_frame)
         self.upload_btn = self.create_tool_button("📁 Upload", self.upload_image, self.toolbar_frame)
         
+        # Watermark Presets
+        self.create_section("Presets")
+        self.preset_var = tk.StringVar()
+        self.preset_menu = ttk.Combobox(self.right_frame, textvariable=self.preset_var,
+                                      values=sorted(self.watermark_presets), state="readonly")
+        self.preset_menu.pack(fill=tk.X, padx=10, pady=(0, 5))
+        self.preset_menu.bind("<<ComboboxSelected>>", self.select_preset)
+        self.save_preset_btn = tk.Button(self.right_frame, text="Save as Preset", command=self.save_preset,
+                                       bg="#4d4d4d", fg=self.text_color, relief=tk.FLAT, bd=0,
+                                       activebackground=self.accent_color)
+        self.save_preset_btn.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
         # Watermark Text
         self.create_section("Watermark Text")
         self.text_entry = tk.Entry(self.right_frame, bg="#4d4d4d", fg=self.text_color, 
@@ -83,6 +147,18 @@ class WatermarkApp:
         self.text_entry.insert(0, self.watermark_text)
         self.text_entry.pack(fill=tk.X, padx=10, pady=(0, 10))
         
+        # Logo (replaces the text while set)
+        self.logo_button = tk.Button(self.right_frame, text="Use Logo Image...", command=self.choose_logo,
+                                   bg="#4d4d4d", fg=self.text_color, relief=tk.FLAT, bd=0,
+                                   activebackground=self.accent_color)
+        self.logo_button.pack(fill=tk.X, padx=10, pady=(0, 5))
+        tk.Label(self.right_frame, text="Logo Width (% of image):", bg=self.panel_color, fg=self.text_color).pack(anchor=tk.W, padx=10)
+        self.logo_scale_slider = tk.Scale(self.right_frame, from_=5, to=100, orient=tk.HORIZONTAL,
+                                        bg=self.panel_color, fg=self.text_color, highlightthickness=0,
+                                        activebackground=self.accent_color, command=self.update_preview)
+        self.logo_scale_slider.set(int(self.logo_scale * 100))
+        self.logo_scale_slider.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
         # Font Settings
         self.create_section("Font Settings")
         
@@ -126,14 +202,8 @@ class WatermarkApp:
         # Position Presets
         tk.Label(self.right_frame, text="Preset Positions:", bg=self.panel_color, fg=self.text_color).pack(anchor=tk.W, padx=10)
         self.position_var = tk.StringVar(value=self.position)
-        positions = [
-            "Top Left", "Top Center", "Top Right",
-            "Center Left", "Center", "Center Right",
-            "Bottom Left", "Bottom Center", "Bottom Right",
-            "Custom"
-        ]
         self.position_menu = ttk.Combobox(self.right_frame, textvariable=self.position_var,
-                                        values=positions, state="readonly")
+                                        values=POSITIONS, state="readonly")
         self.position_menu.pack(fill=tk.X, padx=10, pady=(0, 10))
         self.position_menu.bind("<<ComboboxSelected>>", self.update_preview)
         
@@ -171,11 +241,23 @@ class WatermarkApp:
                                 activebackground="#6a8a6a", state=tk.DISABLED)
         self.save_btn.pack(fill=tk.X, padx=10, pady=5)
         
+        # Export preset: speed vs file size for PNG/JPEG/WebP
+        tk.Label(self.right_frame, text="Export Preset:", bg=self.panel_color, fg=self.text_color).pack(anchor=tk.W, padx=10)
+        self.export_preset_var = tk.StringVar(value="balanced")
+        self.export_preset_menu = ttk.Combobox(self.right_frame, textvariable=self.export_preset_var,
+                                             values=PRESETS, state="readonly")
+        self.export_preset_menu.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
         # Bind events
         self.text_entry.bind("<KeyRelease>", self.update_preview)
         self.canvas.bind("<ButtonPress-1>", self.start_drag)
         self.canvas.bind("<B1-Motion>", self.on_drag)
         self.canvas.bind("<ButtonRelease-1>", self.end_drag)
+        self.canvas.bind("<Configure>", self.on_canvas_resize)
+        
+        # F2: timing/memory overlay, F3: start/stop a cProfile + tracemalloc capture
+        self.root.bind("<F2>", self.toggle_stats_overlay)
+        self.root.bind("<F3>", self.toggle_profiling)
         
     def setup_modern_ui(self):
         # Configure styles
@@ -209,12 +291,19 @@ class WatermarkApp:
         return btn
         
     def update_position_from_sliders(self, event=None):
-        if self.position_var.get() != "Custom":
+        # While dragging, on_drag owns the offsets and only moves the overlay
+        if self.drag_data["item"] is not None:
+            return
+        # Slider moves made by select_preset keep the preset's exact offsets
+        if (self.x_pos_slider.get(), self.y_pos_slider.get()) == self.synced_slider_values:
+            return
+        self.synced_slider_values = None
+        if self.position_var.get() not in ("Custom", "Tiled"):
             self.position_var.set("Custom")
         
         # Convert slider values (-100 to 100) to pixel offsets
-        img_width = self.original_image.width if self.original_image else 1000
-        img_height = self.original_image.height if self.original_image else 1000
+        img_width = self.image_size[0] if self.original_image else 1000
+        img_height = self.image_size[1] if self.original_image else 1000
         
         self.offset_x = int((self.x_pos_slider.get() / 100) * (img_width / 2))
         self.offset_y = int((self.y_pos_slider.get() / 100) * (img_height / 2))
@@ -223,13 +312,19 @@ class WatermarkApp:
         
     def upload_image(self):
         file_path = filedialog.askopenfilename(
-            filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp *.gif *.webp")]
+            filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp *.gif *.webp *.tif *.tiff")]
         )
         if file_path:
             try:
                 self.image_path = file_path
-                self.original_image = Image.open(self.image_path)
-                self.current_image = self.original_image.copy()
+                # Only the header is read here; full-resolution pixels are decoded on apply
+                self.original_image = open_image(self.image_path)
+                self.image_size = oriented_size(self.original_image)
+                self.current_image = self.original_image
+                self.animated = is_animated(self.original_image)
+                self.applied_spec = None
+                self.preview_proxy = None
+                self.preview_scheduler.cancel()
                 self.update_preview()
                 self.apply_btn.config(state=tk.NORMAL)
                 self.save_btn.config(state=tk.DISABLED)
@@ -244,6 +339,9 @@ class WatermarkApp:
                 messagebox.showerror("Error", f"Failed to open image: {str(e)}")
                 self.image_path = ""
                 self.original_image = None
+                self.image_size = None
+                self.animated = False
+                self.preview_proxy = None
     
     def choose_color(self):
         color = colorchooser.askcolor(title="Choose Watermark Color", initialcolor=self.watermark_color)
@@ -251,149 +349,253 @@ class WatermarkApp:
             self.watermark_color = color[1]
             self.update_preview()
     
+    def choose_logo(self):
+        if self.logo_path:
+            self.set_logo("")
+        else:
+            file_path = filedialog.askopenfilename(
+                title="Choose Logo",
+                filetypes=[("Image files", "*.png *.webp *.gif *.bmp *.jpg *.jpeg")]
+            )
+            if not file_path:
+                return
+            try:
+                load_logo(file_path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to open logo: {str(e)}")
+                return
+            self.set_logo(file_path)
+        self.update_preview()
+    
+    def set_logo(self, path):
+        self.logo_path = path
+        if path:
+            self.logo_button.config(text=f"Remove Logo ({os.path.basename(path)})")
+        else:
+            self.logo_button.config(text="Use Logo Image...")
+    
     def update_preview(self, event=None):
         if not self.image_path or not self.original_image:
             return
+        if self.drag_data["item"] is not None:
+            return
             
         try:
             # Get current settings
             self.watermark_text = self.text_entry.get()
-            if not self.watermark_text.strip():
+            if not self.watermark_text.strip() and not self.logo_path:
                 return
                 
             self.font_family = self.font_var.get()
             self.font_size = self.font_size_slider.get()
             self.opacity = self.opacity_slider.get()
             self.position = self.position_var.get()
+            self.logo_scale = self.logo_scale_slider.get() / 100
             
-            # Create preview
-            preview = self.original_image.copy()
-            watermarked = self.add_watermark(preview, preview=True)
+            fit = self.fit_to_canvas(*self.image_size)
+            if fit is None:
+                return
             
-            # Display the image
-            self.display_image(watermarked)
+            # Hand the render to the scheduler; the UI thread never waits on Pillow
+            self.preview_scheduler.request(self.original_image, fit[:2], self.current_spec())
             
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to update preview: {str(e)}")
+            self.preview_failed(e)
+    
+    def render_preview(self, original, size, spec):
+        # Runs on the scheduler's worker thread: no Tk calls in here
+        with stage("preview"):
+            proxy = self.get_preview_proxy(original, size)
+            # Render at canvas resolution so drags cost the same for any source size
+            return add_watermark(proxy, spec.scaled(proxy.width / oriented_size(original)[0]))
+    
+    def preview_failed(self, error):
+        messagebox.showerror("Error", f"Failed to update preview: {str(error)}")
+    
+    def current_spec(self):
+        return WatermarkSpec(
+            text=self.watermark_text,
+            font_family=self.font_family,
+            font_size=int(self.font_size),
+            color=self.watermark_color,
+            opacity=float(self.opacity),
+            position=self.position,
+            offset_x=int(self.offset_x),
+            offset_y=int(self.offset_y),
+            margin=int(self.margin),
+            angle=float(self.angle),
+            tile_gap=int(self.tile_gap),
+            logo=self.logo_path,
+            logo_scale=float(self.logo_scale)
+        )
     
-    def add_watermark(self, image, preview=False):
+    def select_preset(self, event=None):
+        spec = self.watermark_presets.get(self.preset_var.get())
+        if spec is None:
+            return
+        
+        self.text_entry.delete(0, tk.END)
+        self.text_entry.insert(0, spec.text)
+        self.font_var.set(spec.font_family)
+        self.font_size_slider.set(spec.font_size)
+        self.opacity_slider.set(spec.opacity)
+        self.watermark_color = spec.color
+        self.position_var.set(spec.position)
+        self.offset_x = spec.offset_x
+        self.offset_y = spec.offset_y
+        self.margin = spec.margin
+        self.angle = spec.angle
+        self.tile_gap = spec.tile_gap
+        self.set_logo(spec.logo)
+        self.logo_scale_slider.set(int(spec.logo_scale * 100))
+        
+        # Mirror the offsets on the sliders, as on_drag does
+        img_width = self.image_size[0] if self.original_image else 1000
+        img_height = self.image_size[1] if self.original_image else 1000
+        x_percent = max(-100, min(100, int((spec.offset_x / (img_width / 2)) * 100)))
+        y_percent = max(-100, min(100, int((spec.offset_y / (img_height / 2)) * 100)))
+        self.synced_slider_values = (x_percent, y_percent)
+        self.x_pos_slider.set(x_percent)
+        self.y_pos_slider.set(y_percent)
+        
+        self.update_preview()
+    
+    def save_preset(self):
+        name = simpledialog.askstring("Save Preset", "Preset name:", initialvalue=self.preset_var.get(),
+                                      parent=self.root)
+        if not name or not name.strip():
+            return
+        name = name.strip()
+        
+        # Read the controls directly so a preset can be saved before any image is loaded
+        self.watermark_text = self.text_entry.get()
+        self.font_family = self.font_var.get()
+        self.font_size = self.font_size_slider.get()
+        self.opacity = self.opacity_slider.get()
+        self.position = self.position_var.get()
+        self.logo_scale = self.logo_scale_slider.get() / 100
+        
+        presets = dict(self.watermark_presets)
+        presets[name] = self.current_spec()
         try:
-            if not self.watermark_text.strip():
-                return image
-                
-            # Create a transparent layer for the watermark
-            watermark = Image.new("RGBA", image.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(watermark)
-            
-            # Convert color to RGB and add alpha for opacity
-            rgb = Image.new("RGB", (1, 1), self.watermark_color)
-            r, g, b = rgb.getpixel((0, 0))
-            alpha = int(255 * self.opacity)
-            
-            # Load font
-            try:
-                font = ImageFont.truetype(self.font_family + ".ttf", self.font_size)
-            except (OSError, IOError):
-                try:
-                    font = ImageFont.truetype("arial.ttf", self.font_size)
-                except:
-                    font = ImageFont.load_default()
-            
-            # Calculate text size
-            text_bbox = draw.textbbox((0, 0), self.watermark_text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            margin = 20
-            positions = {
-                "Top Left": (margin, margin),
-                "Top Center": ((image.width - text_width) // 2, margin),
-                "Top Right": (image.width - text_width - margin, margin),
-                "Center Left": (margin, (image.height - text_height) // 2),
-                "Center": ((image.width - text_width) // 2, 
-                          (image.height - text_height) // 2),
-                "Center Right": (image.width - text_width - margin,
-                               (image.height - text_height) // 2),
-                "Bottom Left": (margin, image.height - text_height - margin),
-                "Bottom Center": ((image.width - text_width) // 2,
-                                 image.height - text_height - margin),
-                "Bottom Right": (image.width - text_width - margin,
-                               image.height - text_height - margin),
-                "Custom": (image.width // 2 + self.offset_x - text_width // 2,
-                          image.height // 2 + self.offset_y - text_height // 2)
-            }
-            
-            x, y = positions.get(self.position, (margin, margin))
-            
-            # Add text to watermark layer
-            draw.text((x, y), self.watermark_text, font=font, fill=(r, g, b, alpha))
-            
-            # Composite the images
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-                
-            watermarked = Image.alpha_composite(image, watermark)
-            
-            if not preview and image.mode != 'RGBA':
-                watermarked = watermarked.convert(image.mode)
-            
-            return watermarked
-            
+            save_presets(presets)
         except Exception as e:
-            raise e
+            messagebox.showerror("Error", f"Failed to save preset: {str(e)}")
+            return
+        self.watermark_presets = presets
+        self.preset_menu.config(values=sorted(presets))
+        self.preset_var.set(name)
+    
+    def add_watermark(self, image, in_place=False):
+        return add_watermark(image, self.current_spec(), in_place=in_place)
+    
+    def fit_to_canvas(self, width, height):
+        # Calculate available space
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        
+        if canvas_width <= 1 or canvas_height <= 1:
+            return None
+            
+        # Calculate aspect ratio
+        img_ratio = width / height
+        canvas_ratio = canvas_width / canvas_height
+        
+        if img_ratio > canvas_ratio:
+            # Image is wider than canvas
+            new_width = canvas_width
+            new_height = max(1, int(canvas_width / img_ratio))
+        else:
+            # Image is taller than canvas
+            new_height = canvas_height
+            new_width = max(1, int(canvas_height * img_ratio))
+        
+        # Calculate position to center the image
+        x_pos = (canvas_width - new_width) // 2
+        y_pos = (canvas_height - new_height) // 2
+        return new_width, new_height, x_pos, y_pos
+    
+    def get_preview_proxy(self, original, size):
+        # Downscale the original once per load or canvas resize; previews reuse it
+        cached = self.preview_proxy
+        if cached is not None and cached[0] is original and cached[1].size == size:
+            return cached[1]
+        proxy = preview_proxy(original, size)
+        self.preview_proxy = (original, proxy)
+        return proxy
+    
+    def on_canvas_resize(self, event):
+        if not self.original_image:
+            return
+        fit = self.fit_to_canvas(*self.image_size)
+        if fit and (self.preview_proxy is None or self.preview_proxy[1].size != fit[:2]):
+            self.update_preview()
     
     def display_image(self, image):
         try:
-            self.canvas.delete("all")
+            with stage("display"):
+                self.canvas.delete("all")
             
-            # Calculate available space
-            canvas_width = self.canvas.winfo_width()
-            canvas_height = self.canvas.winfo_height()
-            
-            if canvas_width <= 1 or canvas_height <= 1:
-                return
-                
-            # Calculate aspect ratio
-            img_ratio = image.width / image.height
-            canvas_ratio = canvas_width / canvas_height
+                fit = self.fit_to_canvas(image.width, image.height)
+                if fit is None:
+                    return
+                new_width, new_height, x_pos, y_pos = fit
             
-            if img_ratio > canvas_ratio:
-                # Image is wider than canvas
-                new_width = canvas_width
-                new_height = int(canvas_width / img_ratio)
-            else:
-                # Image is taller than canvas
-                new_height = canvas_height
-                new_width = int(canvas_height * img_ratio)
-            
-            # Calculate position to center the image
-            x_pos = (canvas_width - new_width) // 2
-            y_pos = (canvas_height - new_height) // 2
-            
-            # Resize with high-quality downsampling
-            resized_image = image.resize((new_width, new_height), Image.LANCZOS)
+                # Resize with high-quality downsampling (preview proxies are already canvas-sized)
+                if image.size == (new_width, new_height):
+                    resized_image = image
+                else:
+                    resized_image = image.resize((new_width, new_height), Image.LANCZOS, reducing_gap=3.0)
             
-            # Convert to PhotoImage
-            self.photo_img = ImageTk.PhotoImage(resized_image)
+                # Convert to PhotoImage
+                self.photo_img = ImageTk.PhotoImage(resized_image)
             
-            # Display on canvas
-            self.canvas.create_image(x_pos, y_pos, anchor=tk.NW, image=self.photo_img)
+                # Display on canvas
+                self.canvas.create_image(x_pos, y_pos, anchor=tk.NW, image=self.photo_img)
+                self.image_origin = (x_pos, y_pos)
             
-            # Store scaling factors for drag calculations
-            self.scale_x = image.width / new_width
-            self.scale_y = image.height / new_height
+                # Store scaling factors for drag calculations, relative to the full-resolution source
+                source_width, source_height = self.image_size or image.size
+                self.scale_x = source_width / new_width
+                self.scale_y = source_height / new_height
+            self.draw_stats_overlay()
             
         except Exception as e:
             messagebox.showerror("Display Error", f"Failed to display image: {str(e)}")
     
     def start_drag(self, event):
+        # A repeating pattern has no single position to drag; the sliders shift it instead
+        if not self.original_image or self.position_var.get() == "Tiled":
+            return
         if self.position_var.get() != "Custom":
             self.position_var.set("Custom")
+        self.position = "Custom"
         self.drag_data["x"] = event.x
         self.drag_data["y"] = event.y
+        self.drag_data["item"] = self.create_drag_overlay()
+    
+    def create_drag_overlay(self):
+        # Show the bare proxy with the watermark as its own canvas item, so motion events only move it
+        fit = self.fit_to_canvas(*self.image_size)
+        cached = self.preview_proxy
+        if fit is None or cached is None or cached[0] is not self.original_image or cached[1].size != fit[:2]:
+            return None
+        if not self.watermark_text.strip() and not self.logo_path:
+            return None
+        
+        self.preview_scheduler.cancel()
+        proxy = cached[1]
+        spec = self.current_spec().scaled(proxy.width / self.image_size[0])
+        tile, (x, y) = watermark_placement(spec, proxy.size)
+        
+        self.display_image(proxy)
+        self.overlay_img = ImageTk.PhotoImage(tile)
+        origin_x, origin_y = self.image_origin
+        return self.canvas.create_image(origin_x + x, origin_y + y, anchor=tk.NW,
+                                        image=self.overlay_img, tags=("watermark",))
         
     def on_drag(self, event):
-        if self.position_var.get() != "Custom":
+        if not self.original_image or self.position_var.get() != "Custom":
             return
             
         delta_x = event.x - self.drag_data["x"]
@@ -403,43 +605,55 @@ class WatermarkApp:
         self.offset_y += delta_y * self.scale_y
         
         # Update sliders to match new position
-        if self.original_image:
-            img_width = self.original_image.width
-            img_height = self.original_image.height
-            
-            x_percent = int((self.offset_x / (img_width / 2)) * 100)
-            y_percent = int((self.offset_y / (img_height / 2)) * 100)
-            
-            # Clamp values to slider range
-            x_percent = max(-100, min(100, x_percent))
-            y_percent = max(-100, min(100, y_percent))
-            
-            self.x_pos_slider.set(x_percent)
-            self.y_pos_slider.set(y_percent)
+        img_width, img_height = self.image_size
+        
+        x_percent = int((self.offset_x / (img_width / 2)) * 100)
+        y_percent = int((self.offset_y / (img_height / 2)) * 100)
+        
+        # Clamp values to slider range
+        x_percent = max(-100, min(100, x_percent))
+        y_percent = max(-100, min(100, y_percent))
+        
+        self.x_pos_slider.set(x_percent)
+        self.y_pos_slider.set(y_percent)
         
         self.drag_data["x"] = event.x
         self.drag_data["y"] = event.y
         
-        self.update_preview()
+        if self.drag_data["item"] is not None:
+            self.canvas.move(self.drag_data["item"], delta_x, delta_y)
+        else:
+            self.update_preview()
     
     def end_drag(self, event):
         self.drag_data["x"] = 0
         self.drag_data["y"] = 0
+        if self.drag_data["item"] is not None:
+            # Rebuild the real composite once, now that the watermark has settled
+            self.canvas.delete(self.drag_data["item"])
+            self.drag_data["item"] = None
+            self.overlay_img = None
+            self.update_preview()
     
     def apply_watermark(self):
         try:
             if not self.image_path or not self.original_image:
                 return
                 
-            if not self.watermark_text.strip():
-                messagebox.showwarning("Warning", "Please enter watermark text")
+            if not self.watermark_text.strip() and not self.logo_path:
+                messagebox.showwarning("Warning", "Please enter watermark text or choose a logo")
                 return
                 
+            # A queued preview must not replace the applied result
+            self.preview_scheduler.cancel()
+            
             # Save current state to undo stack
             if self.current_image:
-                self.push_undo(self.current_image.copy())
+                self.push_undo(self.applied_spec)
                 
-            watermarked = self.add_watermark(self.original_image.copy())
+            self.applied_spec = self.current_spec()
+            with stage("apply"):
+                watermarked = self.render_frame(self.applied_spec)
             self.current_image = watermarked
             self.display_image(watermarked)
             self.save_btn.config(state=tk.NORMAL)
@@ -457,49 +671,115 @@ class WatermarkApp:
                 ("PNG files", "*.png"), 
                 ("JPEG files", "*.jpg;*.jpeg"), 
                 ("WebP files", "*.webp"),
+                ("GIF files", "*.gif"),
+                ("TIFF files", "*.tif;*.tiff"),
                 ("All files", "*.*")
             ],
             initialfile=os.path.splitext(os.path.basename(self.image_path))[0] + "_watermarked"
         )
         
+        if save_path:
+            # Encode off the Tk thread; the file is written to a temp name and renamed into place
+            target = ExportTarget(save_path, preset=self.export_preset_var.get())
+            if self.animated and self.applied_spec is not None:
+                # Every frame is read and watermarked on the export threads, not just the one on screen
+                future = self.exporter.run(export_animation, self.image_path, self.applied_spec, target)
+            else:
+                # original_image supplies the EXIF/ICC/XMP and, for "keep", the JPEG tables
+                future = self.exporter.submit(self.current_image, [target], source=self.original_image)
+            self.save_btn.config(state=tk.DISABLED, text="Saving...")
+            self.root.after(50, self.check_export, future)
+    
+    def check_export(self, future):
+        if not future.done():
+            self.root.after(50, self.check_export, future)
+            return
+        
+        self.save_btn.config(state=tk.NORMAL, text="Save Image")
+        try:
+            future.result()
+            messagebox.showinfo("Success", "Image saved successfully!")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save image: {str(e)}")
+    
+    def draw_stats_overlay(self):
+        self.canvas.delete("stats")
+        if not self.show_stats:
+            return
+        text = instrumentation.summary(STATS_STAGES) or "No timings yet"
+        item = self.canvas.create_text(10, 8, anchor=tk.NW, text=text, fill=self.accent_color,
+                                       font=('Courier', 9), tags=("stats",))
+        x0, y0, x1, y1 = self.canvas.bbox(item)
+        backdrop = self.canvas.create_rectangle(x0 - 4, y0 - 2, x1 + 4, y1 + 2, fill=self.bg_color,
+                                                outline="", tags=("stats",))
+        self.canvas.tag_lower(backdrop, item)
+    
+    def toggle_stats_overlay(self, event=None):
+        self.show_stats = not self.show_stats
+        self.draw_stats_overlay()
+    
+    def toggle_profiling(self, event=None):
+        if not instrumentation.capturing:
+            instrumentation.reset()
+            instrumentation.start_capture()
+            self.root.title("AquaMark Pro © Dabeey 2025 [profiling - F3 to stop]")
+            return
+        
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json")],
+            initialfile="aquamark-profile"
+        )
+        # The pstats dump sits next to the JSON report for snakeviz and friends
+        profile_path = os.path.splitext(save_path)[0] + ".prof" if save_path else None
+        capture = instrumentation.stop_capture(profile_path=profile_path)
+        self.root.title("AquaMark Pro © Dabeey 2025")
         if save_path:
             try:
-                if save_path.lower().endswith(('.jpg', '.jpeg')):
-                    if self.current_image.mode == 'RGBA':
-                        self.current_image = self.current_image.convert("RGB")
-                    self.current_image.save(save_path, quality=95)
-                elif save_path.lower().endswith('.webp'):
-                    self.current_image.save(save_path, quality=95)
-                else:
-                    self.current_image.save(save_path)
-                    
-                messagebox.showinfo("Success", "Image saved successfully!")
-                
+                instrumentation.to_json(save_path, extra=capture)
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to save image: {str(e)}")
+                messagebox.showerror("Error", f"Failed to write profile: {str(e)}")
+    
+    def render_frame(self, spec):
+        # Materialise a history state, keeping the few most recent frames for instant undo/redo
+        # Rotated photos are turned upright here, on the full decode, rather than at upload
+        if spec is None:
+            return apply_orientation(self.original_image)
+        if spec in self.frame_cache:
+            self.frame_cache.move_to_end(spec)
+            return self.frame_cache[spec]
+        upright = apply_orientation(self.original_image)
+        frame = add_watermark(upright.copy() if upright is self.original_image else upright, spec, in_place=True)
+        self.frame_cache[spec] = frame
+        while len(self.frame_cache) > self.frame_cache_size:
+            self.frame_cache.popitem(last=False)
+        return frame
     
-    def push_undo(self, image):
-        self.undo_stack.append(image)
+    def push_undo(self, spec):
+        self.undo_stack.append(spec)
         self.redo_stack.clear()
         self.update_undo_redo_buttons()
     
     def undo_action(self):
         if self.undo_stack:
-            self.redo_stack.append(self.current_image.copy())
-            self.current_image = self.undo_stack.pop()
+            self.redo_stack.append(self.applied_spec)
+            self.applied_spec = self.undo_stack.pop()
+            self.current_image = self.render_frame(self.applied_spec)
             self.display_image(self.current_image)
             self.update_undo_redo_buttons()
     
     def redo_action(self):
         if self.redo_stack:
-            self.undo_stack.append(self.current_image.copy())
-            self.current_image = self.redo_stack.pop()
+            self.undo_stack.append(self.applied_spec)
+            self.applied_spec = self.redo_stack.pop()
+            self.current_image = self.render_frame(self.applied_spec)
             self.display_image(self.current_image)
             self.update_undo_redo_buttons()
     
     def clear_undo_stacks(self):
         self.undo_stack.clear()
         self.redo_stack.clear()
+        self.frame_cache.clear()
         self.update_undo_redo_buttons()
     
     def update_undo_redo_buttons(self):
@@ -0,0 +1,81 @@
+"""AquaMark Pro - named watermark presets stored in config.ini or JSON
+
+In an INI file each preset is a "[preset: Name]" section whose keys are
+WatermarkSpec fields; other sections ([branding], [ui], ...) are left alone
+when presets are saved. A JSON file maps preset names to objects with the
+same keys. Missing keys take the WatermarkSpec defaults.
+"""
+
+import configparser
+import json
+import os
+from dataclasses import asdict, fields
+
+from watermark import WatermarkSpec, POSITIONS, compile_plan
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
+SECTION_PREFIX = "preset:"
+
+_FIELD_TYPES = {f.name: type(f.default) for f in fields(WatermarkSpec)}
+
+
+def spec_from_dict(values):
+    """Build a WatermarkSpec from (possibly string) values, converting each to its field's type"""
+    unknown = set(values) - set(_FIELD_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown preset keys: {', '.join(sorted(unknown))}")
+    spec = WatermarkSpec(**{key: _FIELD_TYPES[key](value) for key, value in values.items()})
+    if spec.position not in POSITIONS:
+        raise ValueError(f"Unknown position {spec.position!r}")
+    return spec
+
+
+def _is_json(path):
+    return path.lower().endswith(".json")
+
+
+def _read_config(path):
+    config = configparser.ConfigParser(interpolation=None)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config.read_file(f)
+    return config
+
+
+def load_presets(path=CONFIG_PATH):
+    """Return {name: WatermarkSpec} from an INI or JSON file; a missing file has no presets"""
+    if _is_json(path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return {name: spec_from_dict(values) for name, values in json.load(f).items()}
+
+    config = _read_config(path)
+    return {section[len(SECTION_PREFIX):].strip(): spec_from_dict(dict(config[section]))
+            for section in config.sections() if section.startswith(SECTION_PREFIX)}
+
+
+def save_presets(presets, path=CONFIG_PATH):
+    """Write {name: WatermarkSpec} to path, replacing any presets already stored there"""
+    if _is_json(path):
+        data = {name: asdict(spec) for name, spec in presets.items()}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        return
+
+    config = _read_config(path)
+    for section in config.sections():
+        if section.startswith(SECTION_PREFIX):
+            config.remove_section(section)
+    for name, spec in presets.items():
+        config[f"{SECTION_PREFIX} {name}"] = {key: str(value) for key, value in asdict(spec).items()}
+    with open(path, "w", encoding="utf-8") as f:
+        config.write(f)
+
+
+def load_plan(name, path=CONFIG_PATH):
+    """Compile the named preset into a RenderPlan, ready to apply to any number of images"""
+    presets = load_presets(path)
+    if name not in presets:
+        raise KeyError(f"No watermark preset named {name!r} in {os.path.basename(path)}")
+    return compile_plan(presets[name])
@@ -0,0 +1,233 @@
+"""AquaMark Pro - per-stage timing and opt-in profiling
+
+Hot paths wrap their work in ``with stage("name"):``. Timers are always on
+and cost about a microsecond each; the aggregated numbers are available from
+instrumentation.snapshot(), as JSON, or on the in-app overlay (F2).
+
+start_capture() additionally turns on cProfile and/or tracemalloc. Before
+Python 3.12 cProfile only sees the thread it is enabled in, so work that runs
+on background threads goes through run_profiled(), which keeps one profiler
+per thread and merges them all when the capture stops. From 3.12 cProfile
+sees every thread but only one profiler may be active, so a single one is
+shared and run_profiled() just calls through.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# cProfile is built on sys.monitoring from 3.12: process-wide, one profiler at a time
+SHARED_PROFILER = sys.version_info >= (3, 12)
+
+
+class StageStats:
+    """Running totals for one named stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "min_ms": self.min * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "last_ms": self.last * 1000,
+        }
+
+
+class _StageTimer:
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """Collects stage timings and, while capturing, cProfile and tracemalloc data"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.capturing = False
+        self._profilers = {}
+        self._capture_memory = False
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+
+    def last_ms(self, name):
+        stats = self.stages.get(name)
+        return stats.last * 1000 if stats else None
+
+    def memory(self):
+        """Current and peak traced memory while tracemalloc runs, else the process peak RSS (MB)"""
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            return {"traced_mb": current / 2 ** 20, "traced_peak_mb": peak / 2 ** 20}
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is kilobytes on Linux, bytes on macOS
+            return {"peak_rss_mb": peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10}
+        return {}
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: stats.as_dict() for name, stats in sorted(self.stages.items())}
+        return {"stages": stages, "memory": self.memory()}
+
+    def to_json(self, path=None, extra=None):
+        data = self.snapshot()
+        if extra:
+            data.update(extra)
+        text = json.dumps(data, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def start_capture(self, cpu=True, memory=True):
+        """Start cProfile (for this thread and any run_profiled calls) and/or tracemalloc"""
+        if self.capturing:
+            return
+        self.capturing = cpu
+        self._capture_memory = memory and not tracemalloc.is_tracing()
+        if self._capture_memory:
+            tracemalloc.start()
+        if cpu:
+            self._profiler_for_thread().enable()
+
+    def stop_capture(self, top=30, profile_path=None):
+        """Stop capturing and return the hottest functions and allocation sites.
+
+        profile_path, if given, receives the merged cProfile data in pstats
+        format for snakeviz, gprof2dot and friends.
+        """
+        result = {}
+        if self.capturing:
+            self.capturing = False
+            with self._lock:
+                profilers = list(self._profilers.values())
+                self._profilers.clear()
+            stats = None
+            for profiler in profilers:
+                profiler.disable()
+                profiler.create_stats()
+                # pstats refuses profilers that recorded nothing (e.g. created but never run)
+                if not profiler.stats:
+                    continue
+                if stats is None:
+                    stats = pstats.Stats(profiler, stream=io.StringIO())
+                else:
+                    stats.add(profiler)
+            result["cpu"] = []
+            if stats is not None:
+                if profile_path:
+                    stats.dump_stats(profile_path)
+                stats.sort_stats("cumulative")
+                result["cpu"] = [
+                    {
+                        "function": f"{filename}:{line}({name})",
+                        "calls": calls,
+                        "total_ms": total * 1000,
+                        "cumulative_ms": cumulative * 1000,
+                    }
+                    for (filename, line, name), (_, calls, total, cumulative, _)
+                    in sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+                ]
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            result["memory"] = {
+                "traced_mb": current / 2 ** 20,
+                "traced_peak_mb": peak / 2 ** 20,
+                "top_allocations": [
+                    {"where": str(stat.traceback), "size_kb": stat.size / 1024, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:top]
+                ],
+            }
+            if self._capture_memory:
+                tracemalloc.stop()
+                self._capture_memory = False
+        return result
+
+    def run_profiled(self, func, *args, **kwargs):
+        """Call func, under this thread's profiler while a capture is running"""
+        if not self.capturing or SHARED_PROFILER:
+            # The shared profiler already sees this thread
+            return func(*args, **kwargs)
+        profiler = self._profiler_for_thread()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+
+    def _profiler_for_thread(self):
+        ident = None if SHARED_PROFILER else threading.get_ident()
+        with self._lock:
+            profiler = self._profilers.get(ident)
+            if profiler is None:
+                profiler = self._profilers[ident] = cProfile.Profile()
+        return profiler
+
+    def summary(self, names):
+        """One-line "name 1.2 ms" summary of the last run of each stage, plus memory"""
+        parts = []
+        for name in names:
+            last = self.last_ms(name)
+            if last is not None:
+                parts.append(f"{name} {last:.1f} ms")
+        memory = self.memory()
+        if "traced_mb" in memory:
+            parts.append(f"mem {memory['traced_mb']:.0f}/{memory['traced_peak_mb']:.0f} MB")
+        elif "peak_rss_mb" in memory:
+            parts.append(f"peak RSS {memory['peak_rss_mb']:.0f} MB")
+        return " | ".join(parts)
+
+
+instrumentation = Instrumentation()
+stage = instrumentation.stage
@@ -0,0 +1,102 @@
+"""AquaMark Pro - coalescing background render scheduler for the preview"""
+
+import threading
+
+from profiling import instrumentation
+
+
+class PreviewScheduler:
+    """Renders only the newest preview request, off the Tk main thread.
+
+    request() never blocks: it replaces whatever request is still waiting, so a
+    burst of slider ticks or drag events collapses into one render of the
+    latest settings. Results are handed back to deliver() on the Tk thread by a
+    short root.after() poll, because Tk objects such as ImageTk.PhotoImage must
+    only be touched from there.
+    """
+
+    def __init__(self, root, render, deliver, on_error=None, poll_ms=15):
+        self.root = root
+        self.render = render
+        self.deliver = deliver
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._cancelled = 0
+        self._pending = None
+        self._rendering = False
+        self._result = None
+        self._polling = False
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="aquamark-preview", daemon=True)
+        self._thread.start()
+
+    def request(self, *args):
+        """Queue render(*args), superseding any request that hasn't started yet"""
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, args)
+            self._cond.notify()
+        self._start_polling()
+
+    def cancel(self):
+        """Drop queued requests and discard any render that is still in flight"""
+        with self._cond:
+            self._pending = None
+            self._result = None
+            self._cancelled = self._generation
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending = None
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                generation, args = self._pending
+                self._pending = None
+                self._rendering = True
+
+            try:
+                # Profiled when a capture is running; cProfile can't see this thread otherwise
+                result = (generation, instrumentation.run_profiled(self.render, *args), None)
+            except Exception as e:
+                result = (generation, None, e)
+
+            with self._cond:
+                self._rendering = False
+                if generation > self._cancelled:
+                    self._result = result
+
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        with self._cond:
+            result = self._result
+            self._result = None
+            busy = self._rendering or self._pending is not None
+
+        if result is not None:
+            _, image, error = result
+            if error is not None:
+                if self.on_error:
+                    self.on_error(error)
+            else:
+                self.deliver(image)
+
+        if busy:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,371 @@
+"""AquaMark Pro - local HTTP watermarking service
+
+    python server.py --port 8765 -j 4
+
+    curl --data-binary @photo.jpg "http://127.0.0.1:8765/watermark?text=Hello&position=Center" -o out.jpg
+    curl --data-binary @photo.jpg "http://127.0.0.1:8765/watermark?preset=Signature&format=webp" -o out.webp
+    curl http://127.0.0.1:8765/stats
+
+POST /watermark takes the image as the request body. Query parameters are
+WatermarkSpec fields (text, font_family, font_size, color, opacity, position,
+offset_x, offset_y, margin, angle, tile_gap, logo_scale), optionally on top of
+a saved preset, plus format (png, jpeg, webp, ...; default: the input's) and
+export (an export.PRESETS name). Logos can only come from presets, so clients
+cannot make the server read arbitrary files. Animated and multi-page uploads
+are watermarked on every frame.
+
+Rendering runs in a bounded process pool whose workers compile the default
+and saved presets at start-up. Requests that share a spec and arrive within a
+few milliseconds of each other are batched, and each batch is split across
+the workers, so its requests render in parallel while busy periods need
+fewer, larger pool tasks. Once max_pending requests are queued or in flight
+new ones get 503 with Retry-After rather than piling up. Undecodable uploads
+get 400, failures on the server's side 500, and if a worker process dies the
+pool is replaced and the affected requests get 503. Only the Python standard
+library and Pillow are used.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qsl
+from PIL import Image
+
+from watermark import WatermarkSpec, compile_plan
+from presets import CONFIG_PATH, load_presets, spec_from_dict
+from export import PRESETS, encode_image
+from loader import apply_orientation
+from animation import is_animated, read_animation, watermark_animation
+
+DEFAULT_PORT = 8765
+MAX_BODY = 64 * 1024 ** 2
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _init_worker(specs):
+    # Fonts, text masks and logos are loaded before the first request instead of during it
+    for spec in specs:
+        try:
+            compile_plan(spec)
+        except Exception:
+            pass
+
+
+def _render_batch(spec, items):
+    """Watermark several uploads with one spec; runs in a worker process.
+
+    items are (image bytes, output format or None, export preset) tuples.
+    Returns (200, body, content type) or (HTTP status, error message) for each:
+    400 for uploads Pillow can't read, 500 for anything else.
+    """
+    results = []
+    for data, fmt, preset in items:
+        try:
+            # Cached after the first item, and reported per item like any other failure
+            plan = compile_plan(spec)
+            out = io.BytesIO()
+            with Image.open(io.BytesIO(data)) as source:
+                fmt = fmt or source.format or "PNG"
+                if is_animated(source):
+                    # The pool already keeps every core busy, so frames are composited in this process only
+                    watermarked = watermark_animation(read_animation(source), plan, in_place=True, workers=1)
+                else:
+                    image = apply_orientation(source)
+                    image.load()
+                    watermarked = plan.apply(image, in_place=True)
+                encode_image(watermarked, out, fmt, preset, source=source)
+            results.append((200, out.getvalue(), Image.MIME.get(fmt, "application/octet-stream")))
+        except (Image.UnidentifiedImageError, Image.DecompressionBombError, SyntaxError, EOFError) as e:
+            results.append((400, str(e)))
+        except Exception as e:
+            results.append((500, str(e)))
+    return results
+
+
+def check_spec(spec):
+    """Reject client-supplied specs the renderer can't draw, with a 400"""
+    if spec.font_size < 1:
+        raise HTTPError(400, "font_size must be at least 1")
+    if not 0 <= spec.opacity <= 1:
+        raise HTTPError(400, "opacity must be between 0 and 1")
+    if spec.logo_scale <= 0:
+        raise HTTPError(400, "logo_scale must be greater than 0")
+    if spec.logo and spec.position == "Tiled":
+        raise HTTPError(400, "The Tiled position repeats text; logos use the other positions")
+
+
+class _Batch:
+    __slots__ = ("spec", "items", "started")
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.items = []
+        self.started = False
+
+
+class WatermarkServer:
+    """Accepts uploads over HTTP and renders them in batches on a process pool"""
+
+    def __init__(self, workers=None, max_pending=64, max_batch=8, batch_window=0.005,
+                 presets_path=CONFIG_PATH, max_body=MAX_BODY):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_body = max_body
+        # Register every plugin up front so Image.SAVE can validate requested formats
+        Image.init()
+        self.presets = load_presets(presets_path) if os.path.exists(presets_path) else {}
+        self.pool = self._new_pool()
+        # Batches handed to the pool at once; the rest wait here, where they can still grow
+        self.slots = None
+        self.batches = {}
+        self.tasks = set()
+        self.pending = 0
+        self.stats = {"requests": 0, "rejected": 0, "failed": 0, "batches": 0, "batched_requests": 0,
+                      "pool_restarts": 0}
+
+    def _new_pool(self):
+        # Workers are started on first use, after the socket is bound; forked ones would inherit the
+        # listening socket and open connections and keep the port if orphaned, so start them fresh
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=([WatermarkSpec()] + list(self.presets.values()),),
+                                   mp_context=multiprocessing.get_context(method))
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self.slots = asyncio.Semaphore(self.workers * 2)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        if sys.version_info >= (3, 9):
+            self.pool.shutdown(cancel_futures=True)
+        else:
+            self.pool.shutdown()
+
+    # Batching
+
+    def submit(self, spec, item):
+        """Queue one upload for rendering; returns a future of its _render_batch result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.batches.get(spec)
+        if batch is None:
+            batch = self.batches[spec] = _Batch(spec)
+            loop.call_later(self.batch_window, self._start, batch)
+        batch.items.append((item, future))
+        if len(batch.items) >= self.max_batch:
+            self._close(batch)
+            self._start(batch)
+        return future
+
+    def _close(self, batch):
+        # Later requests with this spec start a new batch
+        if self.batches.get(batch.spec) is batch:
+            del self.batches[batch.spec]
+
+    def _start(self, batch):
+        # Called by the window timer and when a batch fills up, whichever is first
+        if not batch.started:
+            batch.started = True
+            # The loop only keeps weak references to tasks
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run_batch(self, batch):
+        async with self.slots:
+            # Until a slot frees up the batch keeps taking same-spec requests, so it grows under load
+            self._close(batch)
+            items = batch.items
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(items)
+            # Workers already hold the compiled plan, so one worker rendering the whole batch would
+            # only queue its requests behind each other; split it into a pool task per worker instead
+            size = -(-len(items) // self.workers)
+            await asyncio.gather(*(self._run_chunk(batch.spec, items[start:start + size])
+                                   for start in range(0, len(items), size)))
+
+    async def _run_chunk(self, spec, chunk):
+        pool = self.pool
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                pool, _render_batch, spec, [item for item, _ in chunk])
+        except BrokenProcessPool:
+            # A worker died (crash, OOM kill); later requests get a fresh pool
+            self._replace_pool(pool)
+            results = [(503, "Worker process failed; retry shortly")] * len(chunk)
+        except Exception as e:
+            results = [(500, f"Worker failed: {e}")] * len(chunk)
+        for (_, future), result in zip(chunk, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _replace_pool(self, broken):
+        # Several chunks can fail on the same broken pool; only the first replaces it
+        if self.pool is broken:
+            self.pool = self._new_pool()
+            self.stats["pool_restarts"] += 1
+            broken.shutdown(wait=False)
+
+    # HTTP
+
+    def parse_spec(self, query):
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        fmt = params.pop("format", "").upper() or None
+        if fmt == "JPG":
+            fmt = "JPEG"
+        if fmt and fmt not in Image.SAVE:
+            raise HTTPError(400, f"Unsupported output format {fmt}")
+        export_preset = params.pop("export", "balanced")
+        if export_preset not in PRESETS:
+            raise HTTPError(400, f"Unknown export preset {export_preset!r}")
+        if "logo" in params:
+            raise HTTPError(400, "Logos can only be set through a preset")
+
+        base = WatermarkSpec()
+        preset = params.pop("preset", None)
+        if preset is not None:
+            if preset not in self.presets:
+                raise HTTPError(400, f"No watermark preset named {preset!r}")
+            base = self.presets[preset]
+        try:
+            # spec_from_dict converts and checks the strings; only the fields given override the preset
+            overrides = spec_from_dict(params)
+            spec = base.with_changes(**{key: getattr(overrides, key) for key in params})
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, str(e))
+        check_spec(spec)
+        return spec, fmt, export_preset
+
+    async def handle_request(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == "/stats":
+            stats = dict(self.stats, pending=self.pending, workers=self.workers,
+                         mean_batch=self.stats["batched_requests"] / max(1, self.stats["batches"]))
+            return 200, "application/json", json.dumps(stats).encode("utf-8"), {}
+        if url.path != "/watermark":
+            raise HTTPError(404, "Not found")
+        if method != "POST":
+            raise HTTPError(405, "Use POST with the image as the body")
+
+        spec, fmt, export_preset = self.parse_spec(url.query)
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            return 503, "text/plain", b"Server busy, retry shortly\n", {"Retry-After": "1"}
+
+        self.pending += 1
+        try:
+            result = await self.submit(spec, (body, fmt, export_preset))
+        finally:
+            self.pending -= 1
+        if result[0] == 503:
+            self.stats["failed"] += 1
+            return 503, "text/plain", (result[1] + "\n").encode(), {"Retry-After": "1"}
+        if result[0] != 200:
+            self.stats["failed"] += 1
+            raise HTTPError(result[0], result[1])
+        return 200, result[2], result[1], {}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (version.strip() == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length > self.max_body:
+                        keep_alive = False
+                        raise HTTPError(413, f"Images over {self.max_body // 1024 ** 2} MB are not accepted")
+                    if method == "POST" and "content-length" not in headers:
+                        keep_alive = False
+                        raise HTTPError(411, "Content-Length is required")
+                    body = await reader.readexactly(length) if length else b""
+                    self.stats["requests"] += 1
+                    status, content_type, payload, extra = await self.handle_request(method, target, body)
+                except HTTPError as e:
+                    status, content_type, payload, extra = e.status, "text/plain", (str(e) + "\n").encode(), {}
+                except Exception as e:
+                    status, content_type, payload, extra = 500, "text/plain", (str(e) + "\n").encode(), {}
+
+                head = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+                        f"Content-Type: {content_type}",
+                        f"Content-Length: {len(payload)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AquaMark Pro local watermarking server")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Interface to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="Requests queued or rendering before new ones get 503")
+    parser.add_argument("--max-batch", type=int, default=8,
+                        help="Most same-spec requests batched together; a batch is split across the workers")
+    parser.add_argument("--batch-window", type=float, default=5.0,
+                        help="Milliseconds to wait for same-spec requests to batch")
+    parser.add_argument("--presets-file", default=CONFIG_PATH)
+    return parser
+
+
+async def serve(args):
+    server = WatermarkServer(workers=args.workers, max_pending=args.max_pending,
+                             max_batch=args.max_batch, batch_window=args.batch_window / 1000,
+                             presets_path=args.presets_file)
+    listener = await server.start(args.host, args.port)
+    print(f"AquaMark Pro serving on http://{args.host}:{args.port} with {server.workers} workers",
+          file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""AquaMark Pro - GUI-free watermark rendering engine"""
+
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from PIL import Image
+
+from fonts import text_mask, text_tile
+from logos import load_logo, logo_tile, logo_width
+from profiling import stage
+import blend
+
+POSITIONS = [
+    "Top Left", "Top Center", "Top Right",
+    "Center Left", "Center", "Center Right",
+    "Bottom Left", "Bottom Center", "Bottom Right",
+    "Custom", "Tiled"
+]
+
+MARGIN = 20
+PLAN_CACHE_SIZE = 32
+ANCHOR_CACHE_SIZE = 64
+
+
+@dataclass(frozen=True)
+class WatermarkSpec:
+    """Everything needed to render one watermark, independent of any widget"""
+    text: str = "Your Watermark"
+    font_family: str = "Arial"
+    font_size: int = 36
+    color: str = "#FFFFFF"
+    opacity: float = 0.7
+    position: str = "Bottom Right"
+    offset_x: int = 0
+    offset_y: int = 0
+    margin: int = MARGIN
+    # "Tiled" only: rotation in degrees (counter-clockwise) and the gap between repeats (0: font size)
+    angle: float = 30.0
+    tile_gap: int = 0
+    # Image logo drawn instead of the text when set; logo_scale is its width as a fraction of the image's
+    logo: str = ""
+    logo_scale: float = 0.2
+
+    def with_changes(self, **changes):
+        return replace(self, **changes)
+
+    def scaled(self, factor):
+        """Spec for rendering onto a copy of the image resized by factor"""
+        if factor == 1:
+            return self
+        return replace(
+            self,
+            font_size=max(1, round(self.font_size * factor)),
+            offset_x=round(self.offset_x * factor),
+            offset_y=round(self.offset_y * factor),
+            margin=round(self.margin * factor),
+            tile_gap=round(self.tile_gap * factor)
+        )
+
+
+def text_fill(spec):
+    # Convert color to RGB and add alpha for opacity
+    rgb = Image.new("RGB", (1, 1), spec.color)
+    r, g, b = rgb.getpixel((0, 0))
+    return (r, g, b, int(255 * spec.opacity))
+
+
+def text_origin(spec, image_size, text_size):
+    width, height = image_size
+    text_width, text_height = text_size
+    margin = spec.margin
+    positions = {
+        "Top Left": (margin, margin),
+        "Top Center": ((width - text_width) // 2, margin),
+        "Top Right": (width - text_width - margin, margin),
+        "Center Left": (margin, (height - text_height) // 2),
+        "Center": ((width - text_width) // 2,
+                   (height - text_height) // 2),
+        "Center Right": (width - text_width - margin,
+                         (height - text_height) // 2),
+        "Bottom Left": (margin, height - text_height - margin),
+        "Bottom Center": ((width - text_width) // 2,
+                          height - text_height - margin),
+        "Bottom Right": (width - text_width - margin,
+                         height - text_height - margin),
+        "Custom": (width // 2 + spec.offset_x - text_width // 2,
+                   height // 2 + spec.offset_y - text_height // 2)
+    }
+    return positions.get(spec.position, (margin, margin))
+
+
+def composite_tile(image, tile, x, y, backend="pillow"):
+    """Alpha-blend tile onto image with its top-left corner at (x, y), touching only that region.
+
+    RGBA images are blended in place. RGB and L images have just the covered
+    region converted to RGBA and back; any other mode is converted to RGBA first.
+    backend="numpy" blends in the image's own mode instead (see blend.py).
+    Returns the resulting image.
+    """
+    if backend == "numpy":
+        return blend.blend_tile(image, tile, x, y)
+
+    # Clip the tile to the image
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + tile.width, image.width), min(y + tile.height, image.height)
+    if x0 >= x1 or y0 >= y1:
+        return image
+    if (x0, y0, x1, y1) != (x, y, x + tile.width, y + tile.height):
+        tile = tile.crop((x0 - x, y0 - y, x1 - x, y1 - y))
+
+    if image.mode == 'RGBA':
+        image.alpha_composite(tile, dest=(x0, y0))
+    elif image.mode in ('RGB', 'L'):
+        region = image.crop((x0, y0, x1, y1)).convert('RGBA')
+        region.alpha_composite(tile)
+        image.paste(region.convert(image.mode), (x0, y0))
+    else:
+        # Palette and other exotic modes stay RGBA rather than being re-quantised
+        image = image.convert('RGBA')
+        image.alpha_composite(tile, dest=(x0, y0))
+    return image
+
+
+@dataclass(frozen=True, eq=False)
+class RenderPlan:
+    """A spec compiled for repeated use: font resolved, text rasterised and coloured.
+
+    The anchor for each image size is worked out once and remembered, so
+    applying the plan to a folder of same-sized photos is just the blend.
+    For the "Tiled" position the tile is the repeating pattern cell and the
+    whole frame is covered in one blend. Logo plans hold the decoded,
+    premultiplied logo and fetch the copy scaled for each image size from
+    the logo cache (see logos.py). Build plans with compile_plan(), which
+    caches them per spec.
+    """
+    spec: WatermarkSpec
+    tile: Image.Image = None
+    ink_offset: tuple = (0, 0)
+    _anchors: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def tiled(self):
+        return self.spec.position == "Tiled"
+
+    def overlay(self, size, origin=(0, 0)):
+        """Tiled plans: the pattern covering a size-sized region at origin in the frame"""
+        return pattern_overlay(self.tile, size, origin, (self.spec.offset_x, self.spec.offset_y))
+
+    def tile_for(self, image_size):
+        """The RGBA tile to blend into an image of image_size (not for tiled plans)"""
+        if self.spec.logo:
+            return logo_tile(self.spec.logo, logo_width(self.spec.logo_scale, image_size), self.spec.opacity)
+        return self.tile
+
+    def placement(self, image_size):
+        """Top-left corner of the tile in an image of image_size"""
+        anchor = self._anchors.get(image_size)
+        if anchor is None:
+            # The tile is cropped to the text's bounding box, so its size is the text size
+            x, y = text_origin(self.spec, image_size, self.tile_for(image_size).size)
+            anchor = (x + self.ink_offset[0], y + self.ink_offset[1])
+            if len(self._anchors) >= ANCHOR_CACHE_SIZE:
+                self._anchors.pop(next(iter(self._anchors)))
+            self._anchors[image_size] = anchor
+        return anchor
+
+    def apply(self, image, in_place=False, backend="pillow"):
+        """Return image with the watermark composited on top (see add_watermark)"""
+        if self.tile is None:
+            return image
+        if self.tiled:
+            if backend == "numpy" and image.mode in blend.NATIVE_MODES:
+                with stage("composite"):
+                    return blend.blend_pattern(image, self.tile, (self.spec.offset_x, self.spec.offset_y))
+            # Cells are only copied into place; the blend itself is a single full-frame pass
+            tile, (x, y) = self.overlay(image.size), (0, 0)
+        else:
+            tile, (x, y) = self.tile_for(image.size), self.placement(image.size)
+        with stage("composite"):
+            if not in_place:
+                image = image.copy()
+            return composite_tile(image, tile, x, y, backend)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_plan(spec):
+    """Return the RenderPlan for spec, building it on first use"""
+    if spec.logo:
+        if spec.position == "Tiled":
+            raise ValueError("The Tiled position repeats text; logos use the other positions")
+        return RenderPlan(spec, load_logo(spec.logo))
+    if not spec.text.strip():
+        return RenderPlan(spec)
+    if spec.position == "Tiled":
+        return RenderPlan(spec, pattern_cell(spec))
+    tile, offset = text_tile(spec.text, spec.font_family, spec.font_size, text_fill(spec))
+    return RenderPlan(spec, tile, offset)
+
+
+def pattern_cell(spec):
+    """Render spec's text once, rotated by spec.angle, into a seamlessly repeating RGBA cell.
+
+    The cell holds two rows of text, the second shifted by half a cell, so a
+    plain grid of cells gives the staggered diagonal pattern.
+    """
+    mask, _ = text_mask(spec.text, spec.font_family, spec.font_size)
+    if spec.angle % 360:
+        mask = mask.rotate(spec.angle, Image.BICUBIC, expand=True)
+    fill = text_fill(spec)
+    # Transparent pixels keep the text colour so the rotated edges don't fringe dark
+    text = Image.new("RGBA", mask.size, fill[:3] + (0,))
+    text.paste(fill, (0, 0) + mask.size, mask)
+
+    gap = spec.tile_gap or spec.font_size
+    width, height = text.width + gap, text.height + gap
+    cell = Image.new("RGBA", (width, 2 * height), fill[:3] + (0,))
+    cell.paste(text, (0, 0))
+    cell.paste(text, (width // 2, height))
+    cell.paste(text, (width // 2 - width, height))
+    return cell
+
+
+def pattern_overlay(cell, size, origin=(0, 0), phase=(0, 0)):
+    """Cover a size-sized region, whose corner sits at origin in the frame, with copies of cell.
+
+    The grid is anchored at phase in frame coordinates, so overlays for
+    neighbouring regions (e.g. strips) line up.
+    """
+    overlay = Image.new("RGBA", size, cell.getpixel((0, 0))[:3] + (0,))
+    cell_width, cell_height = cell.size
+    left = -((origin[0] - phase[0]) % cell_width)
+    top = -((origin[1] - phase[1]) % cell_height)
+    for y in range(top, size[1], cell_height):
+        for x in range(left, size[0], cell_width):
+            overlay.paste(cell, (x, y))
+    return overlay
+
+
+def watermark_placement(spec, image_size):
+    """Return the rendered RGBA text tile and the top-left corner it lands on in an image of image_size"""
+    plan = compile_plan(spec)
+    if plan.tiled:
+        return plan.overlay(image_size), (0, 0)
+    return plan.tile_for(image_size), plan.placement(image_size)
+
+
+def add_watermark(image, spec, in_place=False, backend="pillow"):
+    """Return image with spec's text (or logo) watermark composited on top.
+
+    Only the text's bounding box is rendered and blended, and the compiled
+    plan is cached (see compile_plan), so repeating a spec costs just the
+    blend. The source is copied first unless in_place is True, in which case
+    RGBA, RGB and L images are modified directly. backend selects the blend
+    implementation ("pillow" or "numpy").
+    """
+    return compile_plan(spec).apply(image, in_place, backend)